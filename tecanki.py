@@ -12,14 +12,29 @@ import time
 import re
 import sys
 import os
+import json
+import hashlib
+import sqlite3
+import tempfile
+import zipfile
+import threading
+import shutil
+import signal
+import subprocess
+import html as html_lib
+import random
+import unicodedata
 import requests
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoExpirado
+from contextlib import contextmanager
+from urllib.parse import urljoin
 from typing import Optional, Tuple, Dict
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 from selenium.webdriver.chrome.service import Service
@@ -29,8 +44,19 @@ from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeRemainingColumn
 from rich.prompt import Prompt, IntPrompt
 from rich.table import Table
+from rich.markup import escape
 from rich import box
 
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional: sem ele as imagens ficam como estão
+    Image = None
+
+try:
+    import psutil
+except ImportError:  # psutil é opcional: sem ele a memória é lida do heap JS da página
+    psutil = None
+
 # ═══════════════════════════════════════════════════════════════════════
 # CONFIGURAÇÕES
 # ═══════════════════════════════════════════════════════════════════════
@@ -44,6 +70,36 @@ DELAY_COMENTARIO = 2.0
 DELAY_NAVEGACAO = 2.5
 DELAY_RESPOSTA = 1.0
 DELAY_FORUM = 3.0
+ESPERA_PROXIMA = 20   # segundos aguardando a troca de questão (não escalado pelo ritmo)
+
+# Ritmo adaptativo (token bucket AIMD): os DELAY_* acima são escalados pela taxa atual
+RITMO_TAXA_INICIAL = 1.0      # ações/segundo
+RITMO_TAXA_MIN = 0.2
+RITMO_TAXA_MAX = 4.0
+RITMO_CAPACIDADE = 3          # rajada máxima de ações
+RITMO_INCREMENTO = 0.1        # aumento aditivo após ação rápida
+RITMO_FATOR_REDUCAO = 0.5     # redução multiplicativa após erro/lentidão
+RITMO_RESPOSTA_ALVO = 2.0     # segundos; acima disso conta como lentidão
+RITMO_JANELA_BACKOFF = 5.0    # no máximo uma redução por janela
+
+# Prazos por etapa (segundos); ao estourar, roda a escada de recuperação
+PRAZOS = {
+    "captura": 20,
+    "comentario": 30,
+    "forum": 90,
+    "navegacao": 45,
+    "anki": ANKI_TIMEOUT,
+    "midia": 60,         # orçamento de imagens por questão; as que não couberem ficam com a URL original
+}
+RETENTAR_FALHAS = True   # refaz no final as questões que falharam
+# Etapas que usam o WebDriver: uma thread abandonada nelas bloqueia as seguintes
+ETAPAS_NAVEGADOR = ("captura", "comentario", "forum", "navegacao")
+ESPERA_ETAPA_ABANDONADA = 5   # segundos aguardando a thread abandonada antes de recriar o driver
+
+URL_QUESTAO = "https://www.tecconcursos.com.br/questoes/{id}"
+
+# Captura por snapshot: um único execute_script devolve questão, comentário e fórum
+CAPTURA_SNAPSHOT = True
 
 COMENTARIO_INDISPONIVEL = "Comentário não disponível para esta questão."
 FORUM_INDISPONIVEL = "Fórum não disponível para esta questão."
@@ -51,11 +107,151 @@ FORUM_INDISPONIVEL = "Fórum não disponível para esta questão."
 MAX_IMG_URL_CHARS = 300
 DROP_DATA_URI_IMAGES = True
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Diretório para salvar sessão do navegador
-PERFIL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "navegador_sessao")
+PERFIL_DIR = os.path.join(BASE_DIR, "navegador_sessao")
+
+# Navegador enxuto: bloqueio via CDP (Network.setBlockedURLs) e imagens sem decodificação
+BLOQUEIO_URLS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*googlesyndication.com*",
+    "*doubleclick.net*",
+    "*facebook.net*",
+    "*hotjar.com*",
+    "*clarity.ms*",
+    "*fonts.googleapis.com*",
+    "*fonts.gstatic.com*",
+]
+BLOQUEIO_TIPOS = {
+    "fonte": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "midia": ["*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav"],
+}
+BLOQUEIO_TIPOS_ATIVOS = ["fonte", "midia"]
+HEADLESS_VIEWPORT = (1366, 900)
+
+# Navegador persistente (daemon) com depuração remota, ao qual as execuções se conectam
+DAEMON_PORTA = 9222
+DAEMON_PID_ARQUIVO = os.path.join(BASE_DIR, "navegador_daemon.pid")
+DAEMON_TIMEOUT_INICIO = 20
+
+# Reciclagem do navegador em execuções longas (o SPA acumula memória a cada questão)
+RECICLAR_A_CADA = 300         # questões por ciclo; 0 desativa
+RECICLAR_MEMORIA_MB = 2000    # RSS somado dos processos do navegador (psutil)
+RECICLAR_HEAP_MB = 600        # heap JS da página, usado quando psutil não está instalado
+RECICLAR_DERIVA_CARGA = 2.0   # recicla se a carga recente passar de N vezes a do início do ciclo
+RECICLAR_JANELA = 20          # questões comparadas no início e no fim do ciclo
+RECICLAR_VERIFICAR_A_CADA = 10
+
+# Questões quase duplicadas (republicadas com outro ID): MinHash + LSH sobre enunciado e alternativas
+DUPLICATAS_ACAO = ""          # "pular", "marcar" (tag no card) ou "" (desativado)
+DUPLICATAS_LIMIAR = 0.85      # similaridade de Jaccard estimada entre os shingles
+DUPLICATAS_MIN_PALAVRAS = 15  # questões com menos palavras (ex.: só imagem + Certo/Errado) não são comparadas
+TOKENS_POR_IMAGEM = 8         # cada imagem entra no texto como N tokens derivados do hash do src
+DUPLICATAS_TAG = "tec-duplicata"
+MINHASH_PERMUTACOES = 128
+LSH_BANDAS = 16               # 16 bandas x 8 linhas
+SHINGLE_PALAVRAS = 3
+ARQUIVO_SIMILARIDADE = os.path.join(BASE_DIR, "tecanki_similaridade.json")
+
+# Modelo e campos detectados por perfil do Anki (evita a descoberta a cada execução)
+ARQUIVO_CACHE_ANKI = os.path.join(BASE_DIR, "tecanki_anki_cache.json")
+
+# Hashes do conteúdo já enviado ao Anki (modo atualização)
+ARQUIVO_HASHES = os.path.join(BASE_DIR, "tecanki_hashes.json")
+NOTES_INFO_LOTE = 500
+REGISTRO_SALVAR_A_CADA = 25
+
+# Saída direta em pacote .apkg (sem AnkiConnect)
+SAIDA_APKG_DIR = BASE_DIR
+
+# Modelos Basic aceitos (português / inglês)
+MODELOS_BASICOS = [
+    {"tipo": "Básico", "frente": "Frente", "verso": "Verso"},
+    {"tipo": "Basic", "frente": "Front", "verso": "Back"},
+    {"tipo": "Basico", "frente": "Frente", "verso": "Verso"},
+]
+
+# Exportação das capturas em JSONL (uma linha por questão, para análises)
+EXPORTAR_JSONL = False
+ARQUIVO_JSONL = os.path.join(BASE_DIR, "tecanki_capturas.jsonl")
+
+# Transcodificação de imagens (requer Pillow): reduz, recodifica e envia como mídia local
+TRANSCODIFICAR_IMAGENS = True
+IMAGEM_MAX_LADO = 1600        # px; imagens maiores são reduzidas proporcionalmente
+IMAGEM_FORMATO = "WEBP"       # "WEBP" ou "JPEG"
+IMAGEM_QUALIDADE = 75
+IMAGEM_MIN_BYTES = 30_000     # imagens menores continuam com a URL original
+IMAGEM_PROCESSOS = 2
+MIDIA_DIR = os.path.join(BASE_DIR, "tecanki_midia")
 
 console = Console()
 
+# ═══════════════════════════════════════════════════════════════════════
+# REGISTROS DE DADOS
+# ═══════════════════════════════════════════════════════════════════════
+
+class Alternativa:
+    """Alternativa de uma questão (letra + HTML processado)"""
+    __slots__ = ("letra", "html")
+
+    def __init__(self, letra: str, html: str):
+        self.letra = letra
+        self.html = html
+
+    def como_dict(self) -> dict:
+        return {"letra": self.letra, "html": self.html}
+
+class Questao:
+    """Questão capturada: enunciado, alternativas e HTML final do card"""
+    __slots__ = ("id", "enunciado_html", "alternativas", "html")
+
+    def __init__(self, id: Optional[str], enunciado_html: str, alternativas: list, html: str = ""):
+        self.id = id
+        self.enunciado_html = enunciado_html
+        self.alternativas = alternativas
+        self.html = html
+
+    def como_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "enunciado_html": self.enunciado_html,
+            "alternativas": [a.como_dict() for a in self.alternativas],
+        }
+
+class ComentarioOficial:
+    """Comentário do professor (HTML processado)"""
+    __slots__ = ("html",)
+
+    def __init__(self, html: str):
+        self.html = html
+
+    def como_dict(self) -> dict:
+        return {"html": self.html}
+
+class ComentarioForum:
+    """Comentário de usuário no fórum; votos já convertidos para int"""
+    __slots__ = ("votos", "nome", "foto", "pontos", "data", "texto_html")
+
+    def __init__(self, votos: int, nome: str, foto: str, pontos: str, data: str, texto_html: str):
+        self.votos = votos
+        self.nome = nome
+        self.foto = foto
+        self.pontos = pontos
+        self.data = data
+        self.texto_html = texto_html
+
+    def como_dict(self) -> dict:
+        return {
+            "votos": self.votos,
+            "nome": self.nome,
+            "foto": self.foto,
+            "pontos": self.pontos,
+            "data": self.data,
+            "texto_html": self.texto_html,
+        }
+
 # ═══════════════════════════════════════════════════════════════════════
 # PROCESSAMENTO HTML
 # ═══════════════════════════════════════════════════════════════════════
@@ -226,29 +422,47 @@ def clean_noise(soup: BeautifulSoup, preserve_classes: bool = False):
             if attr not in allowed_attrs:
                 del tag.attrs[attr]
 
-def extract_question_and_choices(soup: BeautifulSoup) -> str:
-    """Extrai questão e alternativas de forma estruturada"""
-    out_parts = []
+FORUM_IMG_STYLE = "max-width: 100%; height: auto; display: block; margin: 10px 0; border-radius: 4px;"
+
+def sanitizar_html_comentario(html: str) -> str:
+    """Sanitiza o texto de um comentário do fórum numa única análise do HTML:
+    remove script/style, aplica a whitelist de clean_noise e ajusta as imagens"""
+    if not html or not html.strip():
+        return ""
+    
+    soup = BeautifulSoup(html, "lxml")
+    for tag in list(soup.find_all(["script", "style"])):
+        tag.decompose()
+    
+    clean_noise(soup)
+    
+    for img in soup.find_all("img"):
+        style = img.get("style", "")
+        img["style"] = f"{style}; {FORUM_IMG_STYLE}" if style else FORUM_IMG_STYLE
+    
+    return "".join(str(ch) for ch in (soup.body or soup).children).strip()
 
+def extrair_registro_questao(soup: BeautifulSoup) -> Optional[Questao]:
+    """Extrai enunciado e alternativas como registro estruturado"""
     container = soup.select_one("article.questao-enunciado")
     if not container:
-        return str(soup.body or soup)
+        return None
 
+    enunciado_html = ""
     enunciado = container.select_one("div.questao-enunciado-texto")
     if enunciado:
         enun = BeautifulSoup(str(enunciado), "lxml")
         convert_texto_monospace_to_pre(enun)
         normalize_mathjax(enun)
         clean_noise(enun)
-        inner_html = "".join(
+        enunciado_html = "".join(
             str(ch) for ch in (enun.body or enun).children
             if not (is_str(ch) and str(ch).strip() == "")
         ).strip()
-        out_parts.append(inner_html)
 
+    alternativas = []
     ul = container.select_one("ul.questao-enunciado-alternativas")
     if ul:
-        itens = []
         for li in ul.find_all("li", recursive=False):
             letra_span = li.select_one(".questao-enunciado-alternativa-opcao label")
             letra = letra_span.get_text(strip=True) if letra_span else ""
@@ -263,12 +477,25 @@ def extract_question_and_choices(soup: BeautifulSoup) -> str:
                     str(ch) for ch in (tx.body or tx).children
                     if not (is_str(ch) and str(ch).strip() == "")
                 ).strip()
-                itens.append(f"  <li>{letra} {texto_inner}</li>")
-        if itens:
-            out_parts.append("<ul>\n" + "\n".join(itens) + "\n</ul>")
+                alternativas.append(Alternativa(letra, texto_inner))
 
+    return Questao(None, enunciado_html, alternativas)
+
+def renderizar_questao(questao: Questao) -> str:
+    """Monta o HTML de enunciado + alternativas"""
+    out_parts = [questao.enunciado_html]
+    if questao.alternativas:
+        itens = [f"  <li>{a.letra} {a.html}</li>" for a in questao.alternativas]
+        out_parts.append("<ul>\n" + "\n".join(itens) + "\n</ul>")
     return "\n".join(p for p in out_parts if p)
 
+def extract_question_and_choices(soup: BeautifulSoup) -> str:
+    """Extrai questão e alternativas de forma estruturada"""
+    questao = extrair_registro_questao(soup)
+    if questao is None:
+        return str(soup.body or soup)
+    return renderizar_questao(questao)
+
 def processar_html(html: str) -> str:
     """Processa HTML"""
     if not html or COMENTARIO_INDISPONIVEL in html:
@@ -294,16 +521,207 @@ def processar_html(html: str) -> str:
                 html_final = "".join(str(ch) for ch in (cm.body or cm).children)
 
         if html_final:
-            final_soup = BeautifulSoup(html_final, "lxml")
-            normalize_mathjax(final_soup)
-            clean_noise(final_soup)
-            inner = "".join(str(ch) for ch in (final_soup.body or final_soup).children).strip()
-            return f'<div style="line-height:1.6; font-size:16px; max-width:100%;">{inner}</div>'
+            return _finalizar_html(html_final)
         else:
             return "ERRO: Nenhum container de questão ou comentário foi encontrado."
     except Exception as e:
         return f"Ocorreu um erro inesperado: {e}"
 
+def _finalizar_html(html_final: str) -> str:
+    """Limpeza final e contêiner padrão do card"""
+    final_soup = BeautifulSoup(html_final, "lxml")
+    normalize_mathjax(final_soup)
+    clean_noise(final_soup)
+    inner = "".join(str(ch) for ch in (final_soup.body or final_soup).children).strip()
+    return f'<div style="line-height:1.6; font-size:16px; max-width:100%;">{inner}</div>'
+
+def processar_questao(html: str, id_questao: Optional[str] = None) -> Questao:
+    """Processa o HTML da questão mantendo enunciado e alternativas no registro"""
+    questao = None
+    if html and html.strip():
+        try:
+            soup = BeautifulSoup(html, "lxml")
+            convert_texto_monospace_to_pre(soup)
+            normalize_mathjax(soup)
+            questao = extrair_registro_questao(soup)
+        except Exception:
+            questao = None
+
+    if questao is None:
+        questao = Questao(id_questao, "", [], processar_html(html))
+        return questao
+
+    questao.id = id_questao
+    html_final = renderizar_questao(questao).strip()
+    questao.html = _finalizar_html(html_final) if html_final else processar_html(html)
+    return questao
+
+# Minificação final do HTML dos campos (antes do envio)
+BLOCOS_HTML = {
+    "address","article","aside","blockquote","br","caption","dd","div","dl","dt","fieldset",
+    "figcaption","figure","footer","form","h1","h2","h3","h4","h5","h6","header","hr","li",
+    "main","nav","ol","p","pre","section","table","tbody","td","tfoot","th","thead","tr","ul",
+}
+VAZIOS_REMOVIVEIS = {"span","div","p","b","strong","i","em","u","font","small","sup","sub"}
+ESPACO_HTML_RE = re.compile(r"[ \t\n\r\f]+")
+ESPACO_PRESERVADO = str.maketrans({" ": "\x01", "\t": "\x02", "\n": "\x03", "\r": "\x04", "\f": "\x05"})
+
+def _estilo_pre(tag) -> bool:
+    """True para pre/textarea e elementos com white-space: pre*"""
+    if tag.name in ("pre", "textarea", "script", "style"):
+        return True
+    return is_tag(tag) and "pre" in parse_style_to_dict(tag.get("style", "")).get("white-space", "")
+
+def _preserva_espacos(no) -> bool:
+    """True se o nó está dentro de um elemento que preserva espaços"""
+    return any(_estilo_pre(pai) for pai in no.parents)
+
+def _eh_bloco(no) -> bool:
+    return no is None or (is_tag(no) and no.name in BLOCOS_HTML)
+
+def texto_visivel(html: str) -> str:
+    """Texto como o navegador o exibe: espaços colapsados fora de pre, quebras nos blocos"""
+    partes = []
+    
+    def percorrer(no, preservar: bool):
+        for filho in no.children:
+            if isinstance(filho, Comment):
+                continue
+            if is_str(filho):
+                partes.append(str(filho).translate(ESPACO_PRESERVADO) if preservar else str(filho))
+            elif filho.name not in ("script", "style"):
+                bloco = filho.name in BLOCOS_HTML
+                if bloco:
+                    partes.append("\n")
+                percorrer(filho, preservar or _estilo_pre(filho))
+                if bloco:
+                    partes.append("\n")
+    
+    percorrer(BeautifulSoup(html, "lxml"), False)
+    return ESPACO_HTML_RE.sub(" ", "".join(partes)).strip()
+
+def minificar_html(html: str) -> str:
+    """Colapsa espaços fora de pre, remove elementos vazios e normaliza atributos.
+
+    Se o texto exibido mudar (texto_visivel), devolve o HTML original.
+    """
+    if not html or not html.strip():
+        return html
+    
+    try:
+        soup = BeautifulSoup(html, "lxml")
+        raiz = soup.body or soup
+        
+        for no in list(raiz.descendants):
+            if isinstance(no, Comment):
+                no.extract()
+                continue
+            if not is_str(no) or _preserva_espacos(no):
+                continue
+            texto = ESPACO_HTML_RE.sub(" ", str(no))
+            if _eh_bloco(no.previous_sibling) and no.parent.name in BLOCOS_HTML | {"body"}:
+                texto = texto.lstrip(" ")
+            if _eh_bloco(no.next_sibling) and no.parent.name in BLOCOS_HTML | {"body"}:
+                texto = texto.rstrip(" ")
+            if texto:
+                no.replace_with(NavigableString(texto))
+            else:
+                no.extract()
+        
+        for tag in reversed(raiz.find_all(True)):
+            if tag.name in VAZIOS_REMOVIVEIS and "style" not in tag.attrs \
+                    and not tag.find(True) and tag.get_text() == "":
+                tag.decompose()
+                continue
+            if tag.get("style"):
+                tag["style"] = re.sub(r"\s*([:;,])\s*", r"\1", ESPACO_HTML_RE.sub(" ", tag["style"])).strip().rstrip(";")
+        
+        minificado = "".join(str(ch) for ch in raiz.children)
+    except Exception:
+        return html
+    
+    if texto_visivel(minificado) != texto_visivel(html):
+        return html
+    return minificado
+
+# ═══════════════════════════════════════════════════════════════════════
+# MODELO TECANKI (FÓRUM RENDERIZADO PELO CARTÃO)
+# ═══════════════════════════════════════════════════════════════════════
+
+# Tipo de nota próprio: o fórum vai como JSON compacto no campo "Forum"
+# e o template do verso monta o HTML na hora da revisão.
+MODELO_TECANKI = {"tipo": "TECANKI", "frente": "Frente", "verso": "Verso", "forum": "Forum"}
+
+TECANKI_CSS = """.card { font-family: arial; font-size: 20px; text-align: left; color: black; background-color: white; }
+.tec-separador { border: none; border-top: 3px solid #2196F3; width: 80%; margin: 50px auto 30px; }
+.tec-forum { font-family: Arial, sans-serif; margin-top: 20px; }
+.tec-forum h2 { color: #2196F3; border-bottom: 3px solid #2196F3; padding-bottom: 8px; margin-bottom: 20px; }
+.tec-comentario { border-left: 4px solid #757575; padding: 15px; margin: 15px 0; background: #fafafa; border-radius: 6px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); }
+.tec-cabecalho { display: flex; align-items: center; margin-bottom: 12px; }
+.tec-avatar { width: 40px; height: 40px; border-radius: 50%; margin-right: 12px; background: linear-gradient(135deg, #1a73e8, #1557b0); color: white; display: flex; align-items: center; justify-content: center; font-weight: 600; font-size: 14px; }
+.tec-autor { flex: 1; }
+.tec-autor strong { color: #333; font-size: 15px; }
+.tec-data { color: #999; font-size: 12px; margin-left: 8px; }
+.tec-votos { color: white; padding: 6px 14px; border-radius: 20px; font-weight: bold; font-size: 13px; min-width: 50px; text-align: center; }
+.tec-texto { line-height: 1.7; color: #333; font-size: 15px; word-wrap: break-word; }
+.tec-texto img { max-width: 100%; height: auto; display: block; margin: 10px 0; border-radius: 4px; }
+"""
+
+TECANKI_FRENTE = "{{Frente}}"
+
+TECANKI_VERSO = """{{FrontSide}}
+
+<hr id=answer>
+
+{{Verso}}
+{{#Forum}}
+<div id="tec-forum"></div>
+<script type="application/json" id="tec-forum-dados">{{Forum}}</script>
+<script>
+(function () {
+  var dados = document.getElementById("tec-forum-dados");
+  var alvo = document.getElementById("tec-forum");
+  if (!dados || !alvo) return;
+  var lista;
+  try { lista = JSON.parse(dados.textContent); } catch (e) { return; }
+  if (!lista.length) return;
+  lista.sort(function (a, b) { return b.votos - a.votos; });
+  function cor(v) { return v > 100 ? "#4CAF50" : v > 20 ? "#2196F3" : v >= 0 ? "#757575" : "#F44336"; }
+  function texto(s) { var d = document.createElement("div"); d.textContent = s || ""; return d.innerHTML; }
+  function iniciais(nome) {
+    var p = (nome || "").split(/\\s+/).filter(Boolean);
+    if (p.length >= 2) return (p[0][0] + p[p.length - 1][0]).toUpperCase();
+    return p.length ? p[0][0].toUpperCase() : "U";
+  }
+  var html = '<hr class="tec-separador"><div class="tec-forum"><h2>Comentários do Fórum (' + lista.length + ' comentários)</h2>';
+  lista.forEach(function (c) {
+    html += '<div class="tec-comentario" style="border-left-color:' + cor(c.votos) + '">'
+      + '<div class="tec-cabecalho"><div class="tec-avatar">' + texto(iniciais(c.autor)) + '</div>'
+      + '<div class="tec-autor"><strong>' + texto(c.autor) + '</strong><span class="tec-data">' + texto(c.data) + '</span></div>'
+      + '<div class="tec-votos" style="background:' + cor(c.votos) + '">+' + c.votos + '</div></div>'
+      + '<div class="tec-texto">' + c.texto + '</div></div>';
+  });
+  alvo.innerHTML = html + '</div>';
+})();
+</script>
+{{/Forum}}"""
+
+def serializar_forum(comentarios: list, textos: Optional[list] = None) -> str:
+    """JSON compacto (autor, votos, data, texto) para o campo Forum do modelo TECANKI.
+
+    '<', '>' e '&' vão como \\u003c/\\u003e/\\u0026: o JSON fica dentro de um <script>
+    e nunca fecha a tag nem é reinterpretado como HTML pelo Anki.
+    """
+    if not comentarios:
+        return ""
+    textos = textos if textos is not None else [c.texto_html for c in comentarios]
+    dados = [
+        {"autor": c.nome, "votos": c.votos, "data": c.data, "texto": t}
+        for c, t in zip(comentarios, textos)
+    ]
+    bruto = json.dumps(dados, ensure_ascii=False, separators=(",", ":"))
+    return bruto.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
 # ═══════════════════════════════════════════════════════════════════════
 # ANKI CLIENT
 # ═══════════════════════════════════════════════════════════════════════
@@ -315,6 +733,7 @@ class AnkiClient:
         self.tipo_nota = None
         self.campo_frente = None
         self.campo_verso = None
+        self.campo_forum = None
     
     def chamar_anki(self, action: str, params: dict = None) -> dict:
         """Faz chamada à API do AnkiConnect"""
@@ -324,7 +743,7 @@ class AnkiClient:
             "params": params or {}
         }
         
-        resp = requests.post(ANKI_ENDPOINT, json=payload, timeout=ANKI_TIMEOUT)
+        resp = requests.post(ANKI_ENDPOINT, json=payload, timeout=PRAZOS["anki"])
         resp.raise_for_status()
         
         data = resp.json()
@@ -343,123 +762,1303 @@ class AnkiClient:
         except:
             return False
     
-    def detectar_modelo_e_campos(self) -> bool:
-        """Detecta automaticamente o modelo Basic em português ou inglês"""
+    def multi(self, acoes: list) -> list:
+        """Executa [(ação, params), ...] numa única requisição; erros de cada ação voltam como Exception"""
+        pedidos = [{"action": acao, "version": ANKI_VERSION, "params": params or {}} for acao, params in acoes]
+        respostas = self.chamar_anki("multi", {"actions": pedidos}) or []
+        return [Exception(r["error"]) if r.get("error") else r.get("result") for r in respostas]
+    
+    def handshake(self, deck: Optional[str] = None, tecanki: bool = False) -> bool:
+        """Versão, perfil ativo, deck e campos dos modelos candidatos numa única chamada multi.
+        
+        O modelo escolhido fica em cache por perfil (ARQUIVO_CACHE_ANKI) e é revalidado
+        pelos modelFieldNames da mesma chamada, sem rodadas extras de descoberta.
+        Erros de conexão (requests) são propagados.
+        """
+        cache = self._ler_cache()
+        if tecanki:
+            candidatos = [MODELO_TECANKI["tipo"]]
+        else:
+            candidatos = [p["modelo"]["tipo"] for p in cache.values() if p.get("modelo")]
+            candidatos += [c["tipo"] for c in MODELOS_BASICOS]
+            candidatos = list(dict.fromkeys(candidatos))
+        
+        acoes = [("version", None), ("getActiveProfile", None)]
+        if deck:
+            acoes.append(("createDeck", {"deck": deck}))
+        acoes += [("modelFieldNames", {"modelName": nome}) for nome in candidatos]
+        
         try:
-            modelos = self.chamar_anki("modelNames")
-            
-            configuracoes = [
-                {"tipo": "Básico", "frente": "Frente", "verso": "Verso"},
-                {"tipo": "Basic", "frente": "Front", "verso": "Back"},
-                {"tipo": "Basico", "frente": "Frente", "verso": "Verso"},
-            ]
-            
-            for config in configuracoes:
-                if config["tipo"] in modelos:
-                    campos = self.chamar_anki("modelFieldNames", {"modelName": config["tipo"]})
-                    
-                    if config["frente"] in campos and config["verso"] in campos:
-                        self.tipo_nota = config["tipo"]
-                        self.campo_frente = config["frente"]
-                        self.campo_verso = config["verso"]
-                        
-                        console.print(f"[green]Modelo detectado: '{self.tipo_nota}'[/green]")
-                        console.print(f"[green]Campos: '{self.campo_frente}' / '{self.campo_verso}'[/green]")
-                        return True
-            
-            console.print("[yellow]Modelos disponíveis no Anki:[/yellow]")
-            for modelo in modelos:
-                campos = self.chamar_anki("modelFieldNames", {"modelName": modelo})
-                console.print(f"   - {modelo}: {campos}")
+            resultados = self.multi(acoes)
+            if isinstance(resultados[0], Exception):
+                raise resultados[0]
+            console.print("[green]AnkiConnect OK[/green]")
+            if deck and isinstance(resultados[2], Exception):
+                raise Exception(f"Erro ao criar deck: {resultados[2]}")
+            perfil = resultados[1] if isinstance(resultados[1], str) else "padrao"
+            campos = {
+                nome: r for nome, r in zip(candidatos, resultados[len(acoes) - len(candidatos):])
+                if isinstance(r, list)
+            }
             
+            entrada = dict(cache.get(perfil, {}))
+            if tecanki:
+                ok = self._preparar_modelo_tecanki(campos.get(MODELO_TECANKI["tipo"]), entrada)
+            else:
+                ok = self._escolher_modelo(campos, entrada)
+        except requests.RequestException:
+            raise
+        except Exception as e:
+            console.print(f"[red]Erro ao preparar o Anki: {e}[/red]")
             return False
-            
+        
+        if ok and entrada != cache.get(perfil):
+            cache[perfil] = entrada
+            self._gravar_cache(cache)
+        return ok
+    
+    def _escolher_modelo(self, campos: dict, entrada: dict) -> bool:
+        """Escolhe o modelo Basic: primeiro o do cache do perfil, depois MODELOS_BASICOS"""
+        cacheado = entrada.get("modelo")
+        opcoes = ([cacheado] if cacheado else []) + MODELOS_BASICOS
+        for config in opcoes:
+            existentes = campos.get(config["tipo"], [])
+            if config["frente"] in existentes and config["verso"] in existentes:
+                self.tipo_nota = config["tipo"]
+                self.campo_frente = config["frente"]
+                self.campo_verso = config["verso"]
+                entrada["modelo"] = {"tipo": self.tipo_nota, "frente": self.campo_frente, "verso": self.campo_verso}
+                
+                origem = " (cache)" if config is cacheado else ""
+                console.print(f"[green]Modelo detectado: '{self.tipo_nota}'{origem}[/green]")
+                console.print(f"[green]Campos: '{self.campo_frente}' / '{self.campo_verso}'[/green]")
+                return True
+        
+        # Nenhum candidato: lista os modelos e campos (também numa única chamada)
+        modelos = self.chamar_anki("modelNames")
+        todos = self.multi([("modelFieldNames", {"modelName": m}) for m in modelos])
+        console.print("[yellow]Modelos disponíveis no Anki:[/yellow]")
+        for modelo, campos_modelo in zip(modelos, todos):
+            console.print(f"   - {modelo}: {campos_modelo}")
+        return False
+    
+    def _preparar_modelo_tecanki(self, campos: Optional[list], entrada: dict) -> bool:
+        """Cria o modelo TECANKI ou atualiza template e estilo quando mudaram desde a última execução"""
+        m = MODELO_TECANKI
+        template = {"Name": "Card 1", "Front": TECANKI_FRENTE, "Back": TECANKI_VERSO}
+        assinatura = hashlib.sha1((TECANKI_FRENTE + TECANKI_VERSO + TECANKI_CSS).encode("utf-8")).hexdigest()
+        
+        if campos is None:
+            self.chamar_anki("createModel", {
+                "modelName": m["tipo"],
+                "inOrderFields": [m["frente"], m["verso"], m["forum"]],
+                "css": TECANKI_CSS,
+                "cardTemplates": [template],
+            })
+            console.print(f"[green]Modelo '{m['tipo']}' criado no Anki[/green]")
+        elif any(m[c] not in campos for c in ("frente", "verso", "forum")):
+            console.print(f"[red]Modelo '{m['tipo']}' existe mas sem os campos {m['frente']}/{m['verso']}/{m['forum']}[/red]")
+            return False
+        elif entrada.get("tecanki") != assinatura:
+            for r in self.multi([
+                ("updateModelTemplates", {"model": {"name": m["tipo"], "templates": {"Card 1": template}}}),
+                ("updateModelStyling", {"model": {"name": m["tipo"], "css": TECANKI_CSS}}),
+            ]):
+                if isinstance(r, Exception):
+                    raise r
+            console.print(f"[green]Template do modelo '{m['tipo']}' atualizado[/green]")
+        
+        entrada["tecanki"] = assinatura
+        self.tipo_nota, self.campo_frente, self.campo_verso, self.campo_forum = m["tipo"], m["frente"], m["verso"], m["forum"]
+        console.print(f"[green]Modelo: '{self.tipo_nota}' (fórum renderizado pelo cartão)[/green]")
+        return True
+    
+    def detectar_modelo_e_campos(self) -> bool:
+        """Detecta automaticamente o modelo Basic em português ou inglês"""
+        try:
+            return self.handshake()
         except Exception as e:
             console.print(f"[red]Erro ao detectar modelo: {e}[/red]")
             return False
     
+    def usar_modelo_tecanki(self) -> bool:
+        """Cria (ou atualiza template e estilo) o modelo TECANKI com o campo Forum"""
+        try:
+            return self.handshake(tecanki=True)
+        except Exception as e:
+            console.print(f"[red]Erro ao preparar modelo {MODELO_TECANKI['tipo']}: {e}[/red]")
+            return False
+    
+    @staticmethod
+    def _ler_cache() -> dict:
+        if not os.path.exists(ARQUIVO_CACHE_ANKI):
+            return {}
+        try:
+            with open(ARQUIVO_CACHE_ANKI, "r", encoding="utf-8") as f:
+                return json.load(f).get("perfis", {})
+        except Exception:
+            return {}
+    
+    @staticmethod
+    def _gravar_cache(perfis: dict):
+        temporario = ARQUIVO_CACHE_ANKI + ".tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump({"perfis": perfis}, f, ensure_ascii=False)
+            os.replace(temporario, ARQUIVO_CACHE_ANKI)
+        except OSError as e:
+            console.print(f"[yellow]Cache do Anki não gravado: {e}[/yellow]")
+    
+    def _campos(self, frente: str, verso: str, forum: Optional[str]) -> dict:
+        campos = {self.campo_frente: frente, self.campo_verso: verso}
+        if self.campo_forum:
+            campos[self.campo_forum] = forum or ""
+        return campos
+    
     def criar_deck(self, nome: str):
         """Cria deck se não existir"""
         self.chamar_anki("createDeck", {"deck": nome})
     
-    def adicionar_nota(self, deck: str, frente: str, verso: str):
-        """Adiciona nota ao Anki - PERMITE DUPLICATAS"""
+    def adicionar_nota(self, deck: str, frente: str, verso: str, id_questao: Optional[str] = None,
+                       forum: Optional[str] = None, tags: Optional[list] = None) -> int:
+        """Adiciona nota ao Anki - PERMITE DUPLICATAS. Retorna o ID da nota"""
         if not self.tipo_nota:
             raise Exception("Modelo não foi detectado. Execute detectar_modelo_e_campos() primeiro.")
         
         nota = {
             "deckName": deck,
             "modelName": self.tipo_nota,
-            "fields": {
-                self.campo_frente: frente,
-                self.campo_verso: verso
-            },
+            "fields": self._campos(frente, verso, forum),
             "options": {
                 "allowDuplicate": True,
                 "duplicateScope": "deck"
             },
-            "tags": ["tec-concursos"]
+            "tags": ["tec-concursos"] + (tags or [])
         }
         
-        self.chamar_anki("addNote", {"note": nota})
+        return self.chamar_anki("addNote", {"note": nota})
+
+    def atualizar_nota(self, nota_id: int, frente: str, verso: str, forum: Optional[str] = None):
+        """Atualiza os campos de uma nota existente"""
+        if not self.tipo_nota:
+            raise Exception("Modelo não foi detectado. Execute detectar_modelo_e_campos() primeiro.")
+
+        self.chamar_anki("updateNoteFields", {
+            "note": {
+                "id": nota_id,
+                "fields": self._campos(frente, verso, forum)
+            }
+        })
+
+    def adicionar_midia(self, nome: str, caminho: str):
+        """Envia um arquivo local para a pasta de mídia do Anki"""
+        self.chamar_anki("storeMediaFile", {"filename": nome, "path": caminho})
+
+    def info_notas(self, ids: list) -> list:
+        """Consulta notesInfo em lotes (uma chamada por lote, não por nota)"""
+        resultado = []
+        for i in range(0, len(ids), NOTES_INFO_LOTE):
+            lote = ids[i:i + NOTES_INFO_LOTE]
+            resultado.extend(self.chamar_anki("notesInfo", {"notes": lote}) or [])
+        return resultado
 
 # ═══════════════════════════════════════════════════════════════════════
-# GERENCIADOR DE COMENTÁRIOS DO FÓRUM
+# PACOTE .APKG (SAÍDA DIRETA, SEM ANKICONNECT)
 # ═══════════════════════════════════════════════════════════════════════
 
-class ForumManager:
-    """Gerencia extração e formatação de comentários do fórum TEC"""
-    
-    SELECTORS = {
-        "container": "ul.discussao-comentarios",
-        "comentario_item": "li",
-        "comentario_visivel": ".discussao-comentario-corpo",
-        "votos": ".discussao-comentario-nota-numero span",
-        "usuario_foto": ".post-cabecalho-perfil a img",
-        "usuario_nome": ".link-professor",
-        "usuario_pontos": ".votos .pontos",
-        "comentario_data": ".post-cabecalho-perfil-data",
-        "comentario_texto": ".discussao-comentario-post-texto",
-    }
-    
-    def __init__(self, driver):
-        self.driver = driver
-    
-    def abrir_forum(self) -> bool:
-        """Pressiona F para abrir comentários do fórum"""
-        try:
-            console.print("[cyan]Abrindo forum...[/cyan]")
-            body = self.driver.find_element(By.TAG_NAME, "body")
-            body.send_keys("f")
-            time.sleep(DELAY_FORUM)
-            
+APKG_SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null,
+    tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (
+    usn integer not null, oid integer not null, type integer not null
+);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+APKG_DCONF_PADRAO = {
+    "id": 1, "name": "Default", "mod": 0, "usn": 0, "dyn": False,
+    "maxTaken": 60, "timer": 0, "autoplay": True, "replayq": True,
+    "new": {"bury": True, "delays": [1, 10], "initialFactor": 2500,
+            "ints": [1, 4, 7], "order": 1, "perDay": 20, "separate": True},
+    "lapse": {"delays": [10], "leechAction": 0, "leechFails": 8, "minInt": 1, "mult": 0},
+    "rev": {"bury": True, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1,
+            "maxIvl": 36500, "minSpace": 1, "perDay": 100},
+}
+
+APKG_CSS_PADRAO = ".card {\n font-family: arial;\n font-size: 20px;\n text-align: left;\n color: black;\n background-color: white;\n}\n"
+
+def _id_estavel(chave: str) -> int:
+    """ID numérico determinístico (modelo/deck) a partir de uma chave"""
+    return int(hashlib.sha1(chave.encode("utf-8")).hexdigest()[:12], 16)
+
+def _guid_questao(chave: str) -> str:
+    """GUID estável da nota: reimportar o mesmo ID TEC atualiza a nota em vez de duplicar"""
+    return hashlib.sha1(f"tecanki:{chave}".encode("utf-8")).hexdigest()[:16]
+
+def _texto_sem_html(html: str) -> str:
+    """Texto puro usado nos campos de ordenação/checksum do Anki"""
+    texto = re.sub(r"<[^>]+>", " ", html or "")
+    return re.sub(r"\s+", " ", texto).strip()
+
+class PacoteAnki:
+    """Grava as notas num pacote .apkg (coleção SQLite + mídia num zip), sem o Anki aberto.
+
+    Tem a mesma interface de AnkiClient; as notas ficam em memória e são gravadas
+    numa única transação em finalizar().
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self.tipo_nota = None
+        self.campo_frente = None
+        self.campo_verso = None
+        self.campo_forum = None
+        self.decks = {}
+        self.notas = []
+        self.midias = {}
+        self._proximo_id = int(time.time() * 1000)
+
+    def testar_conexao(self) -> bool:
+        """Não depende de conexão - sempre disponível"""
+        return True
+
+    def detectar_modelo_e_campos(self) -> bool:
+        """Usa o mesmo modelo Basic/Básico do Anki aberto, se houver; senão, 'Basic'"""
+        anki = AnkiClient()
+        if anki.testar_conexao() and anki.detectar_modelo_e_campos():
+            self.tipo_nota = anki.tipo_nota
+            self.campo_frente = anki.campo_frente
+            self.campo_verso = anki.campo_verso
+            return True
+
+        padrao = MODELOS_BASICOS[1]
+        self.tipo_nota = padrao["tipo"]
+        self.campo_frente = padrao["frente"]
+        self.campo_verso = padrao["verso"]
+        console.print(f"[green]Modelo do pacote: '{self.tipo_nota}' ({self.campo_frente} / {self.campo_verso})[/green]")
+        return True
+
+    def usar_modelo_tecanki(self) -> bool:
+        """Usa o modelo TECANKI (Frente/Verso/Forum) com o template que renderiza o fórum"""
+        m = MODELO_TECANKI
+        self.tipo_nota, self.campo_frente, self.campo_verso, self.campo_forum = m["tipo"], m["frente"], m["verso"], m["forum"]
+        console.print(f"[green]Modelo do pacote: '{self.tipo_nota}' (fórum renderizado pelo cartão)[/green]")
+        return True
+
+    def criar_deck(self, nome: str):
+        """Registra o deck no pacote"""
+        self.decks.setdefault(nome, _id_estavel(f"deck:{nome}"))
+
+    def adicionar_nota(self, deck: str, frente: str, verso: str, id_questao: Optional[str] = None,
+                       forum: Optional[str] = None, tags: Optional[list] = None) -> int:
+        """Enfileira nota para o pacote. Retorna o ID da nota"""
+        if not self.tipo_nota:
+            raise Exception("Modelo não foi detectado. Execute detectar_modelo_e_campos() primeiro.")
+
+        self.criar_deck(deck)
+        nota_id = self._novo_id()
+        guid = _guid_questao(id_questao or RegistroHashes.calcular_hash(frente, verso, forum))
+        campos = [frente, verso] + ([forum or ""] if self.campo_forum else [])
+        self.notas.append((nota_id, guid, deck, campos, ["tec-concursos"] + (tags or [])))
+        return nota_id
+
+    def adicionar_midia(self, nome: str, caminho: str):
+        """Inclui um arquivo de mídia no pacote"""
+        self.midias[nome] = caminho
+
+    def _novo_id(self) -> int:
+        self._proximo_id += 1
+        return self._proximo_id
+
+    def _modelo_json(self, modelo_id: int, deck_id: int, agora: int) -> dict:
+        campos = [self.campo_frente, self.campo_verso] + ([self.campo_forum] if self.campo_forum else [])
+        if self.campo_forum:
+            css, qfmt, afmt = TECANKI_CSS, TECANKI_FRENTE, TECANKI_VERSO
+        else:
+            css = APKG_CSS_PADRAO
+            qfmt = "{{%s}}" % self.campo_frente
+            afmt = "{{FrontSide}}\n\n<hr id=answer>\n\n{{%s}}" % self.campo_verso
+        return {
+            "id": modelo_id, "name": self.tipo_nota, "type": 0, "mod": agora, "usn": -1,
+            "sortf": 0, "did": deck_id, "tags": [], "vers": [], "req": [[0, "any", [0]]],
+            "css": css,
+            "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n"
+                        "\\usepackage[utf8]{inputenc}\n\\usepackage{amssymb,amsmath}\n"
+                        "\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+            "latexPost": "\\end{document}",
+            "flds": [
+                {"name": nome, "ord": i, "sticky": False, "rtl": False,
+                 "font": "Arial", "size": 20, "media": []}
+                for i, nome in enumerate(campos)
+            ],
+            "tmpls": [{
+                "name": "Card 1", "ord": 0, "did": None, "bqfmt": "", "bafmt": "",
+                "qfmt": qfmt,
+                "afmt": afmt,
+            }],
+        }
+
+    @staticmethod
+    def _deck_json(deck_id: int, nome: str, agora: int) -> dict:
+        return {
+            "id": deck_id, "name": nome, "mod": agora, "usn": -1, "desc": "",
+            "dyn": 0, "conf": 1, "collapsed": False, "extendNew": 10, "extendRev": 50,
+            "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0],
+        }
+
+    def _abrir_destino(self) -> zipfile.ZipFile:
+        """Cria o .apkg sem sobrescrever um existente (que pode ainda não ter sido importado)"""
+        base, extensao = os.path.splitext(self.caminho)
+        caminho, n = self.caminho, 1
+        while True:
             try:
-                WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, self.SELECTORS["container"]))
-                )
-                time.sleep(2.0)
-                console.print("[green]Forum carregado[/green]")
-                return True
-            except TimeoutException:
-                console.print("[yellow]Forum não disponível[/yellow]")
-                return False
-                
+                zf = zipfile.ZipFile(caminho, "x", zipfile.ZIP_DEFLATED)
+                self.caminho = caminho
+                return zf
+            except FileExistsError:
+                n += 1
+                caminho = f"{base}_{n}{extensao}"
+
+    def finalizar(self) -> str:
+        """Grava coleção e mídia no arquivo .apkg. Retorna o caminho gerado"""
+        agora = int(time.time())
+        modelo_id = _id_estavel(f"modelo:{self.tipo_nota}:{self.campo_frente}:{self.campo_verso}:{self.campo_forum or ''}")
+        deck_padrao = next(iter(self.decks.values()), 1)
+
+        decks = {"1": self._deck_json(1, "Default", agora)}
+        for nome, deck_id in self.decks.items():
+            decks[str(deck_id)] = self._deck_json(deck_id, nome, agora)
+
+        conf = {
+            "nextPos": len(self.notas) + 1, "estTimes": True, "activeDecks": [1],
+            "sortType": "noteFld", "timeLim": 0, "sortBackwards": False, "addToCur": True,
+            "curDeck": 1, "newBury": True, "newSpread": 0, "dueCounts": True,
+            "curModel": str(modelo_id), "collapseTime": 1200,
+        }
+
+        notas, cards = [], []
+        for pos, (nota_id, guid, deck, campos, tags) in enumerate(self.notas, 1):
+            sfld = _texto_sem_html(campos[0])
+            csum = int(hashlib.sha1(sfld.encode("utf-8")).hexdigest()[:8], 16)
+            notas.append((nota_id, guid, modelo_id, agora, -1, f" {' '.join(tags)} ",
+                          "\x1f".join(campos), sfld, csum, 0, ""))
+            cards.append((self._novo_id(), nota_id, self.decks[deck], 0, agora, -1,
+                          0, 0, pos, 0, 0, 0, 0, 0, 0, 0, 0, ""))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho_db = os.path.join(tmp, "collection.anki2")
+            conn = sqlite3.connect(caminho_db)
+            try:
+                conn.executescript(APKG_SCHEMA)
+                with conn:
+                    conn.execute(
+                        "INSERT INTO col VALUES (1,?,?,?,11,0,0,0,?,?,?,?,?)",
+                        (agora, agora * 1000, agora * 1000, json.dumps(conf),
+                         json.dumps({str(modelo_id): self._modelo_json(modelo_id, deck_padrao, agora)}),
+                         json.dumps(decks), json.dumps({"1": APKG_DCONF_PADRAO}), "{}")
+                    )
+                    conn.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", notas)
+                    conn.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", cards)
+            finally:
+                conn.close()
+
+            mapa_midia = {}
+            with self._abrir_destino() as zf:
+                zf.write(caminho_db, "collection.anki2")
+                for idx, (nome, origem) in enumerate(self.midias.items()):
+                    zf.write(origem, str(idx))
+                    mapa_midia[str(idx)] = nome
+                zf.writestr("media", json.dumps(mapa_midia))
+
+        return self.caminho
+
+# ═══════════════════════════════════════════════════════════════════════
+# REGISTRO DE CONTEÚDO (ATUALIZAÇÃO INCREMENTAL)
+# ═══════════════════════════════════════════════════════════════════════
+
+class RegistroHashes:
+    """Guarda, por deck e ID de questão, a nota criada e o hash do conteúdo enviado"""
+
+    def __init__(self, caminho: Optional[str] = ARQUIVO_HASHES):
+        self.caminho = caminho  # None: só em memória
+        self.decks = {}
+        self.alterado = False
+        self.pendentes = 0
+        self.enviadas = set()   # (deck, ID) gravados no Anki nesta execução
+        self._lock = threading.Lock()   # envios ao Anki podem terminar após o prazo, na thread
+
+    def carregar(self):
+        """Carrega o registro do disco (se existir)"""
+        if not self.caminho or not os.path.exists(self.caminho):
+            return
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            self.decks = dados.get("decks", {})
         except Exception as e:
-            console.print(f"[yellow]Erro ao abrir forum: {e}[/yellow]")
-            return False
-    
-    def extrair_comentarios(self) -> list:
-        """Extrai todos os comentários visíveis do fórum"""
-        comentarios = []
-        
+            console.print(f"[yellow]Registro de hashes ilegível, ignorando: {e}[/yellow]")
+            self.decks = {}
+
+    def salvar(self):
+        """Grava o registro no disco (escrita atômica)"""
+        with self._lock:
+            self._salvar()
+
+    def _salvar(self):
+        if not self.caminho or not self.alterado:
+            return
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"decks": self.decks}, f, ensure_ascii=False)
+        os.replace(temporario, self.caminho)
+        self.alterado = False
+        self.pendentes = 0
+
+    @staticmethod
+    def calcular_hash(frente: str, verso: str, forum: Optional[str] = None) -> str:
+        """Hash da frente, do verso (ou do comentário oficial) e do fórum serializado, se houver"""
+        h = hashlib.sha1()
+        h.update(frente.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(verso.encode("utf-8"))
+        if forum:
+            h.update(b"\x00")
+            h.update(forum.encode("utf-8"))
+        return h.hexdigest()
+
+    def total(self, deck: str) -> int:
+        """Quantas questões do deck são conhecidas"""
+        return len(self.decks.get(deck, {}))
+
+    def obter(self, deck: str, id_questao: Optional[str]) -> Optional[dict]:
+        """Retorna {"nota", "hash"} da questão no deck, se conhecida"""
+        if not id_questao:
+            return None
+        return self.decks.get(deck, {}).get(id_questao)
+
+    def registrar(self, deck: str, id_questao: Optional[str], nota_id: int, hash_conteudo: str):
+        """Registra a nota e o hash enviados para a questão no deck"""
+        if not id_questao or not nota_id:
+            return
+        with self._lock:
+            self.decks.setdefault(deck, {})[id_questao] = {"nota": nota_id, "hash": hash_conteudo}
+            self.enviadas.add((deck, id_questao))
+            self.alterado = True
+            self.pendentes += 1
+            if self.pendentes >= REGISTRO_SALVAR_A_CADA:
+                self._salvar()
+
+    def enviada(self, deck: str, id_questao: Optional[str]) -> bool:
+        """Se a questão já foi gravada no Anki nesta execução"""
+        with self._lock:
+            return (deck, id_questao) in self.enviadas
+
+    def validar_com_anki(self, anki: AnkiClient) -> int:
+        """Remove entradas cujas notas não existem mais no Anki. Retorna quantas foram removidas"""
+        entradas = [(deck, q, e) for deck, questoes in self.decks.items() for q, e in questoes.items()]
+        if not entradas:
+            return 0
+
+        existentes = {info["noteId"] for info in anki.info_notas([e["nota"] for _, _, e in entradas]) if info}
+        removidas = 0
+        for deck, id_questao, entrada in entradas:
+            if entrada["nota"] not in existentes:
+                del self.decks[deck][id_questao]
+                removidas += 1
+
+        if removidas:
+            self.alterado = True
+        return removidas
+
+# ═══════════════════════════════════════════════════════════════════════
+# LISTA DE QUESTÕES (NAVEGAÇÃO DIRETA POR ID)
+# ═══════════════════════════════════════════════════════════════════════
+
+RESULTADOS_CONCLUIDOS = ("criada", "atualizada", "inalterada", "duplicada")
+NAO_ENCONTRADA = "não encontrada"   # ID removido ou inválido: não é retentado nem reprocessado
+
+def ler_lista_ids(caminho: str) -> Tuple[list, int]:
+    """Lê IDs ou URLs de questões (um ou mais por linha). Retorna (ids sem duplicatas, duplicados)"""
+    ids = []
+    vistos = set()
+    duplicados = 0
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            for token in re.split(r"[\s,;]+", linha.strip()):
+                if not token:
+                    continue
+                m = re.search(r"/questoes/(\d+)", token) or re.fullmatch(r"#?(\d+)", token)
+                if not m:
+                    continue
+                id_questao = m.group(1)
+                if id_questao in vistos:
+                    duplicados += 1
+                    continue
+                vistos.add(id_questao)
+                ids.append(id_questao)
+    return ids, duplicados
+
+def dividir_lista(ids: list, parte: int, partes: int) -> list:
+    """Fatia contígua `parte` (1..partes) da lista, para dividir entre workers"""
+    tamanho = -(-len(ids) // partes)
+    return ids[(parte - 1) * tamanho:parte * tamanho]
+
+class ProgressoLista:
+    """Resultado de cada ID de uma lista, salvo em disco para permitir retomar"""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self.resultados = {}
+        self.pendentes_gravacao = 0
+
+    def carregar(self):
+        """Carrega resultados de uma execução anterior (se houver)"""
+        if not os.path.exists(self.caminho):
+            return
         try:
-            try:
-                container = self.driver.find_element(By.CSS_SELECTOR, self.SELECTORS["container"])
-            except NoSuchElementException:
-                console.print("[yellow]Container de comentários não encontrado[/yellow]")
-                return []
-            
-            itens = container.find_elements(By.CSS_SELECTOR, self.SELECTORS["comentario_item"])
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                self.resultados = json.load(f).get("resultados", {})
+        except Exception as e:
+            console.print(f"[yellow]Progresso ilegível, ignorando: {e}[/yellow]")
+            self.resultados = {}
+
+    def salvar(self):
+        """Grava os resultados (escrita atômica)"""
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"resultados": self.resultados}, f, ensure_ascii=False, indent=1)
+        os.replace(temporario, self.caminho)
+        self.pendentes_gravacao = 0
+
+    def registrar(self, id_questao: str, resultado: str):
+        """Registra o resultado de um ID"""
+        self.resultados[id_questao] = resultado
+        self.pendentes_gravacao += 1
+        if self.pendentes_gravacao >= REGISTRO_SALVAR_A_CADA:
+            self.salvar()
+
+    def concluido(self, id_questao: str) -> bool:
+        return self.resultados.get(id_questao) in RESULTADOS_CONCLUIDOS + (NAO_ENCONTRADA,)
+
+    def primeiro_pendente(self, ids: list) -> int:
+        """Índice do primeiro ID ainda não processado com sucesso"""
+        for idx, id_questao in enumerate(ids):
+            if not self.concluido(id_questao):
+                return idx
+        return len(ids)
+
+# ═══════════════════════════════════════════════════════════════════════
+# EXPORTAÇÃO JSONL
+# ═══════════════════════════════════════════════════════════════════════
+
+class ExportadorJSONL:
+    """Grava cada captura como uma linha JSON assim que é processada (streaming)"""
+
+    def __init__(self, caminho: str = ARQUIVO_JSONL):
+        self.caminho = caminho
+        self.arquivo = open(caminho, "a", encoding="utf-8")
+
+    def escrever(self, questao: Questao, comentario: Optional[ComentarioOficial], forum: list):
+        """Acrescenta uma questão com comentário oficial e fórum"""
+        linha = {
+            "questao": questao.como_dict(),
+            "comentario": comentario.como_dict() if comentario else None,
+            "forum": [c.como_dict() for c in forum],
+            "capturado_em": int(time.time()),
+        }
+        self.arquivo.write(json.dumps(linha, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.arquivo.flush()
+
+    def fechar(self):
+        """Fecha o arquivo"""
+        self.arquivo.close()
+
+# ═══════════════════════════════════════════════════════════════════════
+# MÍDIA (TRANSCODIFICAÇÃO DE IMAGENS)
+# ═══════════════════════════════════════════════════════════════════════
+
+IMG_SRC_RE = re.compile(r"""(<img\b[^>]*?\bsrc=)(["'])(.*?)\2""", re.IGNORECASE | re.DOTALL)
+
+def _transcodificar_imagem(origem: str, destino: str, max_lado: int, formato: str, qualidade: int) -> Optional[int]:
+    """Reduz e recodifica uma imagem (roda no pool de processos).
+
+    Retorna o tamanho do arquivo gerado, ou None se não ficou menor que o original.
+    """
+    with Image.open(origem) as img:
+        img.load()
+        if max(img.size) > max_lado:
+            img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+        if formato == "JPEG" and img.mode not in ("RGB", "L"):
+            fundo = Image.new("RGB", img.size, "white")
+            fundo.paste(img, mask=img.convert("RGBA").split()[-1])
+            img = fundo
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")
+        img.save(destino, formato, quality=qualidade, optimize=True)
+
+    tamanho = os.path.getsize(destino)
+    if tamanho >= os.path.getsize(origem):
+        os.remove(destino)
+        return None
+    return tamanho
+
+class TranscodificadorMidia:
+    """Baixa as imagens dos cards, reduz/recodifica num pool de processos e envia como mídia.
+
+    O cache (por URL e por hash do original) fica em MIDIA_DIR e vale entre execuções.
+    """
+
+    def __init__(self, anki, diretorio: str = MIDIA_DIR):
+        self.anki = anki
+        self.diretorio = diretorio
+        self.indice_caminho = os.path.join(diretorio, "indice.json")
+        self.urls = {}
+        self.arquivos = {}
+        self.enviadas = set()
+        self.bytes_originais = 0
+        self.bytes_finais = 0
+        self.sessao = requests.Session()
+        self.pool = None
+        self.alterado = False
+
+    def carregar(self):
+        """Carrega o índice do cache (se existir)"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        if not os.path.exists(self.indice_caminho):
+            return
+        try:
+            with open(self.indice_caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            self.urls = dados.get("urls", {})
+            self.arquivos = dados.get("arquivos", {})
+        except Exception as e:
+            console.print(f"[yellow]Cache de mídia ilegível, ignorando: {e}[/yellow]")
+
+    def salvar(self):
+        """Grava o índice do cache (escrita atômica)"""
+        if not self.alterado:
+            return
+        temporario = self.indice_caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"urls": self.urls, "arquivos": self.arquivos}, f, ensure_ascii=False)
+        os.replace(temporario, self.indice_caminho)
+        self.alterado = False
+
+    def usar_cookies(self, cookies: list):
+        """Reaproveita a sessão logada do navegador nos downloads"""
+        for c in cookies or []:
+            self.sessao.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+
+    def processar(self, *htmls: str) -> list:
+        """Troca o src das imagens grandes pela versão compacta. Retorna os HTMLs na mesma ordem.
+
+        Tudo cabe em PRAZOS["midia"] segundos; o que passar disso mantém a URL original.
+        """
+        limite = time.time() + PRAZOS["midia"]
+        urls = []
+        for h in htmls:
+            for m in IMG_SRC_RE.finditer(h or ""):
+                url = html_lib.unescape(m.group(3)).strip()
+                if url.lower().startswith(("http://", "https://", "/")) and url not in urls:
+                    urls.append(url)
+
+        nomes = self._resolver(urls, limite)
+        if not nomes:
+            return list(htmls)
+
+        def trocar(m):
+            nome = nomes.get(html_lib.unescape(m.group(3)).strip())
+            return f"{m.group(1)}{m.group(2)}{nome}{m.group(2)}" if nome else m.group(0)
+
+        return [IMG_SRC_RE.sub(trocar, h) if h else h for h in htmls]
+
+    def _resolver(self, urls: list, limite: float) -> dict:
+        """Garante a versão compacta de cada URL (cache ou pool). Retorna {url: nome da mídia}"""
+        pendentes = {}
+        for url in urls:
+            if url in self.urls:
+                continue
+            restante = limite - time.time()
+            if restante <= 0:
+                console.print("[yellow]Orçamento de mídia esgotado - demais imagens mantidas com a URL original[/yellow]")
+                break
+            try:
+                origem, chave = self._baixar(url, restante)
+            except Exception as e:
+                console.print(f"[yellow]Imagem não baixada ({escape(str(e))})[/yellow]")
+                continue
+
+            self.urls[url] = chave
+            self.alterado = True
+            if chave in self.arquivos or chave in pendentes:
+                os.remove(origem)
+                continue
+            if os.path.getsize(origem) < IMAGEM_MIN_BYTES:
+                self.arquivos[chave] = {"nome": None}
+                os.remove(origem)
+                continue
+            pendentes[chave] = origem
+
+        if pendentes:
+            self._transcodificar(pendentes, limite)
+
+        nomes = {}
+        for url in urls:
+            info = self.arquivos.get(self.urls.get(url))
+            if info and info.get("nome") and (info["nome"] in self.enviadas or time.time() < limite) and self._enviar(info):
+                nomes[url] = info["nome"]
+        return nomes
+
+    def _baixar(self, url: str, prazo: float) -> Tuple[str, str]:
+        """Baixa o original para o diretório de cache. Retorna (caminho, hash)"""
+        resp = self.sessao.get(urljoin(URL_QUESTAO, url), timeout=prazo)
+        resp.raise_for_status()
+        chave = hashlib.sha1(resp.content).hexdigest()
+        origem = os.path.join(self.diretorio, f"original_{chave}")
+        with open(origem, "wb") as f:
+            f.write(resp.content)
+        return origem, chave
+
+    def _transcodificar(self, pendentes: dict, limite: float):
+        """Recodifica os originais no pool de processos e registra o resultado no cache"""
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=IMAGEM_PROCESSOS)
+
+        extensao = "jpg" if IMAGEM_FORMATO == "JPEG" else IMAGEM_FORMATO.lower()
+        tarefas = {}
+        for chave, origem in pendentes.items():
+            nome = f"tecanki_{chave[:16]}.{extensao}"
+            tarefas[chave] = (origem, nome, self.pool.submit(
+                _transcodificar_imagem, origem, os.path.join(self.diretorio, nome),
+                IMAGEM_MAX_LADO, IMAGEM_FORMATO, IMAGEM_QUALIDADE
+            ))
+
+        for chave, (origem, nome, futuro) in tarefas.items():
+            try:
+                tamanho = futuro.result(timeout=max(0, limite - time.time()))
+                if tamanho is None:
+                    self.arquivos[chave] = {"nome": None}
+                else:
+                    self.arquivos[chave] = {"nome": nome, "origem": os.path.getsize(origem), "final": tamanho}
+            except FuturoExpirado:
+                # Fora do orçamento: fica com a URL original agora e é refeita numa próxima vez
+                self.urls = {u: c for u, c in self.urls.items() if c != chave}
+                futuro.add_done_callback(lambda _, o=origem: os.path.exists(o) and os.remove(o))
+                continue
+            except Exception as e:
+                console.print(f"[yellow]Imagem mantida como está ({escape(str(e))})[/yellow]")
+                self.arquivos[chave] = {"nome": None}
+            os.remove(origem)
+
+    def _enviar(self, info: dict) -> bool:
+        """Envia a mídia ao destino uma vez por execução e contabiliza a economia"""
+        nome = info["nome"]
+        if nome in self.enviadas:
+            return True
+        caminho = os.path.join(self.diretorio, nome)
+        if not os.path.exists(caminho):
+            return False
+        try:
+            self.anki.adicionar_midia(nome, caminho)
+        except Exception as e:
+            console.print(f"[yellow]Mídia não enviada ({escape(str(e))})[/yellow]")
+            return False
+        self.enviadas.add(nome)
+        self.bytes_originais += info["origem"]
+        self.bytes_finais += info["final"]
+        return True
+
+    def resumo(self) -> dict:
+        """Imagens enviadas e bytes economizados na coleção"""
+        return {"imagens": len(self.enviadas), "originais": self.bytes_originais, "finais": self.bytes_finais}
+
+    def fechar(self):
+        """Grava o cache e encerra o pool de processos"""
+        self.salvar()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+# ═══════════════════════════════════════════════════════════════════════
+# SIMILARIDADE (QUASE DUPLICATAS)
+# ═══════════════════════════════════════════════════════════════════════
+
+MINHASH_PRIMO = (1 << 61) - 1
+_gerador = random.Random(20240601)
+MINHASH_COEFICIENTES = [
+    (_gerador.randrange(1, MINHASH_PRIMO), _gerador.randrange(0, MINHASH_PRIMO))
+    for _ in range(MINHASH_PERMUTACOES)
+]
+
+def normalizar_texto(html: str) -> str:
+    """Texto sem HTML, acentos, pontuação e caixa, para comparar questões"""
+    texto = html_lib.unescape(_texto_sem_html(html)).lower()
+    texto = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", texto))
+
+def texto_comparavel(html: str) -> Tuple[str, int]:
+    """Texto normalizado com as imagens representadas pelo src. Retorna (texto, palavras de texto)
+
+    Cada imagem vira TOKENS_POR_IMAGEM tokens tirados do hash do src, para pesar como uma frase:
+    dois enunciados iguais com imagens diferentes não passam do limiar.
+    """
+    texto = normalizar_texto(html)
+    tokens = []
+    for m in IMG_SRC_RE.finditer(html or ""):
+        digest = hashlib.blake2b(html_lib.unescape(m.group(3)).strip().encode("utf-8"), digest_size=TOKENS_POR_IMAGEM).hexdigest()
+        tokens.extend(f"img{i}{digest[2 * i:2 * i + 2]}" for i in range(TOKENS_POR_IMAGEM))
+    return " ".join([texto] + tokens).strip(), len(texto.split())
+
+def texto_questao(questao: Questao) -> Tuple[str, int]:
+    """Enunciado e alternativas comparáveis (o HTML final se o registro não tiver enunciado)"""
+    partes = [questao.enunciado_html] + [a.html for a in questao.alternativas]
+    if not questao.enunciado_html:
+        partes = [questao.html]
+    return texto_comparavel(" ".join(partes))
+
+class IndiceSimilaridade:
+    """Assinaturas MinHash das questões já processadas, com bandas LSH para busca sublinear.
+
+    Só as assinaturas vão para o disco; as bandas são reconstruídas ao carregar.
+    """
+
+    def __init__(self, caminho: str = ARQUIVO_SIMILARIDADE, limiar: float = DUPLICATAS_LIMIAR):
+        self.caminho = caminho
+        self.limiar = limiar
+        self.linhas = MINHASH_PERMUTACOES // LSH_BANDAS
+        self.assinaturas = {}
+        self.bandas = {}
+        self.alterado = False
+
+    def carregar(self):
+        """Carrega as assinaturas do disco (se existir e tiver os mesmos parâmetros)"""
+        if not os.path.exists(self.caminho):
+            return
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except Exception as e:
+            console.print(f"[yellow]Índice de similaridade ilegível, ignorando: {e}[/yellow]")
+            return
+        if dados.get("parametros") != self._parametros():
+            console.print("[yellow]Parâmetros do índice de similaridade mudaram - recomeçando[/yellow]")
+            return
+        for chave, assinatura in dados.get("questoes", {}).items():
+            self._indexar(chave, assinatura)
+
+    def salvar(self):
+        """Grava as assinaturas (escrita atômica)"""
+        if not self.alterado:
+            return
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"parametros": self._parametros(), "questoes": self.assinaturas}, f, separators=(",", ":"))
+        os.replace(temporario, self.caminho)
+        self.alterado = False
+
+    @staticmethod
+    def _parametros() -> list:
+        return [MINHASH_PERMUTACOES, LSH_BANDAS, SHINGLE_PALAVRAS, TOKENS_POR_IMAGEM]
+
+    @staticmethod
+    def assinatura(texto: str) -> list:
+        """Assinatura MinHash dos shingles de SHINGLE_PALAVRAS palavras"""
+        palavras = texto.split()
+        n = min(SHINGLE_PALAVRAS, len(palavras)) or 1
+        shingles = {" ".join(palavras[i:i + n]) for i in range(max(len(palavras) - n + 1, 1))}
+        valores = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big")
+                   for sh in shingles]
+        return [min((a * v + b) % MINHASH_PRIMO for v in valores) for a, b in MINHASH_COEFICIENTES]
+
+    def _chaves_bandas(self, assinatura: list) -> list:
+        return [
+            f"{i}:{hashlib.blake2b(repr(assinatura[i * self.linhas:(i + 1) * self.linhas]).encode(), digest_size=8).hexdigest()}"
+            for i in range(LSH_BANDAS)
+        ]
+
+    def _indexar(self, chave: str, assinatura: list):
+        self.assinaturas[chave] = assinatura
+        for banda in self._chaves_bandas(assinatura):
+            self.bandas.setdefault(banda, set()).add(chave)
+
+    @staticmethod
+    def similaridade(a: list, b: list) -> float:
+        """Jaccard estimada: fração de posições iguais nas assinaturas"""
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    def consultar(self, assinatura: list, ignorar: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """Questão indexada mais parecida acima do limiar (só candidatas das bandas LSH)"""
+        candidatas = set()
+        for banda in self._chaves_bandas(assinatura):
+            candidatas |= self.bandas.get(banda, set())
+        candidatas.discard(ignorar)
+
+        melhor = None
+        for chave in candidatas:
+            sim = self.similaridade(assinatura, self.assinaturas[chave])
+            if sim >= self.limiar and (melhor is None or sim > melhor[1]):
+                melhor = (chave, sim)
+        return melhor
+
+    def adicionar(self, chave: str, assinatura: list):
+        """Indexa uma questão processada"""
+        if self.assinaturas.get(chave) == assinatura:
+            return
+        if chave in self.assinaturas:
+            for banda in self._chaves_bandas(self.assinaturas[chave]):
+                self.bandas.get(banda, set()).discard(chave)
+        self._indexar(chave, assinatura)
+        self.alterado = True
+
+def avaliar_similaridade(caminho: str):
+    """Precisão/revocação do detector num arquivo JSONL de pares rotulados.
+
+    Cada linha: {"a": "texto ou HTML", "b": "texto ou HTML", "duplicata": true|false}
+    """
+    vp = fp = fn = vn = 0
+    erros = []
+    with open(caminho, "r", encoding="utf-8") as f:
+        pares = [json.loads(linha) for linha in f if linha.strip()]
+
+    for n, par in enumerate(pares, 1):
+        (texto_a, palavras_a), (texto_b, palavras_b) = texto_comparavel(par["a"]), texto_comparavel(par["b"])
+        achado = None
+        if min(palavras_a, palavras_b) >= DUPLICATAS_MIN_PALAVRAS:
+            indice = IndiceSimilaridade(caminho=os.devnull)
+            indice.adicionar("a", IndiceSimilaridade.assinatura(texto_a))
+            achado = indice.consultar(IndiceSimilaridade.assinatura(texto_b))
+        previsto, rotulo = achado is not None, bool(par["duplicata"])
+        if previsto and rotulo:
+            vp += 1
+        elif previsto:
+            fp += 1
+            erros.append((n, "falso positivo", achado[1]))
+        elif rotulo:
+            fn += 1
+            erros.append((n, "falso negativo", None))
+        else:
+            vn += 1
+
+    tabela = Table(box=box.ROUNDED, show_header=False, padding=(0, 2))
+    tabela.add_column("Item", style="cyan bold")
+    tabela.add_column("Valor", style="white")
+    tabela.add_row("Pares", str(len(pares)))
+    tabela.add_row("Limiar", f"{DUPLICATAS_LIMIAR:.2f} ({MINHASH_PERMUTACOES} permutações, {LSH_BANDAS} bandas)")
+    tabela.add_row("Precisão", f"{vp / (vp + fp):.3f}" if vp + fp else "-")
+    tabela.add_row("Revocação", f"{vp / (vp + fn):.3f}" if vp + fn else "-")
+    tabela.add_row("VP / FP / FN / VN", f"{vp} / {fp} / {fn} / {vn}")
+    for linha, tipo, sim in erros[:10]:
+        tabela.add_row("", f"[dim]linha {linha}: {tipo}{f' (similaridade {sim:.2f})' if sim else ''}[/dim]")
+    console.print(Panel(tabela, title="[bold cyan]SIMILARIDADE[/bold cyan]", border_style="cyan"))
+
+# ═══════════════════════════════════════════════════════════════════════
+# CONTROLE DE RITMO
+# ═══════════════════════════════════════════════════════════════════════
+
+class _MedicaoRitmo:
+    """Resultado de uma ação: descartada (não informa nada) ou com falha"""
+    __slots__ = ("descartada", "falha")
+
+    def __init__(self):
+        self.descartada = False
+        self.falha = False
+
+    def descartar(self):
+        """Não usar esta ação para ajustar a taxa (ex.: conteúdo inexistente)"""
+        self.descartada = True
+
+    def falhou(self):
+        """Conta a ação como erro"""
+        self.falha = True
+
+class ControladorRitmo:
+    """Token bucket com taxa adaptativa (AIMD), compartilhado entre threads e navegadores.
+
+    Ações rápidas aumentam a taxa de forma aditiva; erros ou respostas acima de
+    RITMO_RESPOSTA_ALVO reduzem a taxa de forma multiplicativa (backoff).
+
+    Toda ação que carrega página, envia tecla ao site ou captura conteúdo passa por
+    acao(). Ficam de fora só leituras locais do DOM já carregado, que não geram
+    requisição ao TEC: validar_questao, obter_id_questao (current_url), memoria_mb e os
+    campos de cada item em _extrair_dados_comentario. Várias delas rodam dentro de uma
+    ação já medida, e uma ação aninhada esperaria outro token e zeraria as pausas da externa.
+    """
+
+    def __init__(self):
+        self.taxa = RITMO_TAXA_INICIAL
+        self.tokens = float(RITMO_CAPACIDADE)
+        self.ultimo_reabastecimento = time.monotonic()
+        self.ultimo_backoff = 0.0
+        self.acoes = 0
+        self.erros = 0
+        self.tempo_resposta_total = 0.0
+        self.eventos_backoff = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _reabastecer(self):
+        agora = time.monotonic()
+        self.tokens = min(RITMO_CAPACIDADE, self.tokens + (agora - self.ultimo_reabastecimento) * self.taxa)
+        self.ultimo_reabastecimento = agora
+
+    def aguardar(self):
+        """Bloqueia até haver um token disponível"""
+        while True:
+            with self._lock:
+                self._reabastecer()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.taxa
+            time.sleep(espera)
+
+    def escala(self) -> float:
+        """Fator aplicado aos DELAY_*: < 1 quando o site responde bem, > 1 em backoff"""
+        return min(4.0, max(0.25, RITMO_TAXA_INICIAL / self.taxa))
+
+    def pausa(self, base: float):
+        """Espera base * escala; não conta como tempo de resposta da ação atual"""
+        duracao = base * self.escala()
+        time.sleep(duracao)
+        self._local.pausado = getattr(self._local, "pausado", 0.0) + duracao
+
+    def registrar(self, nome: str, tempo_resposta: float, erro: bool = False):
+        """Ajusta a taxa com base no resultado de uma ação"""
+        with self._lock:
+            self._reabastecer()
+            self.acoes += 1
+            self.tempo_resposta_total += tempo_resposta
+            if erro:
+                self.erros += 1
+
+            if erro or tempo_resposta > RITMO_RESPOSTA_ALVO:
+                agora = time.monotonic()
+                if agora - self.ultimo_backoff >= RITMO_JANELA_BACKOFF:
+                    anterior = self.taxa
+                    self.taxa = max(RITMO_TAXA_MIN, self.taxa * RITMO_FATOR_REDUCAO)
+                    self.ultimo_backoff = agora
+                    self.eventos_backoff.append({
+                        "acao": nome,
+                        "motivo": "erro" if erro else f"lento ({tempo_resposta:.1f}s)",
+                        "de": anterior,
+                        "para": self.taxa,
+                    })
+            else:
+                self.taxa = min(RITMO_TAXA_MAX, self.taxa + RITMO_INCREMENTO)
+
+    @contextmanager
+    def acao(self, nome: str):
+        """Envolve uma interação com o site: aguarda token, mede e registra o resultado"""
+        self.aguardar()
+        medicao = _MedicaoRitmo()
+        self._local.pausado = 0.0
+        inicio = time.monotonic()
+        try:
+            yield medicao
+        except Exception:
+            self.registrar(nome, time.monotonic() - inicio - self._local.pausado, erro=True)
+            raise
+        if not medicao.descartada:
+            self.registrar(nome, time.monotonic() - inicio - self._local.pausado, erro=medicao.falha)
+
+    def resumo(self) -> dict:
+        """Estado atual para o relatório"""
+        with self._lock:
+            return {
+                "taxa": self.taxa,
+                "acoes": self.acoes,
+                "erros": self.erros,
+                "tempo_medio": self.tempo_resposta_total / self.acoes if self.acoes else 0.0,
+                "backoffs": list(self.eventos_backoff),
+            }
+
+ritmo = ControladorRitmo()
+
+# ═══════════════════════════════════════════════════════════════════════
+# PRAZOS POR ETAPA
+# ═══════════════════════════════════════════════════════════════════════
+
+class PrazoExcedido(Exception):
+    """Uma etapa passou do prazo configurado em PRAZOS"""
+
+    def __init__(self, etapa: str, prazo: float):
+        super().__init__(f"Prazo da etapa '{etapa}' excedido ({prazo}s)")
+        self.etapa = etapa
+
+class FalhaNavegador(Exception):
+    """A página não está no estado esperado (ex.: questão aberta mas não capturável)"""
+
+class QuestaoNaoEncontrada(Exception):
+    """A URL abriu normalmente, mas não é uma questão (ID removido ou inválido)"""
+
+# Só estes acionam a escada de recuperação; os demais (Anki, processamento) não são do navegador
+ERROS_NAVEGADOR = (PrazoExcedido, WebDriverException, FalhaNavegador)
+
+_abandonadas = []   # threads de etapas do navegador que estouraram o prazo
+
+def navegador_ocupado(espera: float = 0) -> bool:
+    """Aguarda até `espera` segundos as threads abandonadas; True se alguma ainda usa o driver"""
+    limite = time.time() + espera
+    for thread in _abandonadas:
+        thread.join(max(0, limite - time.time()))
+    _abandonadas[:] = [t for t in _abandonadas if t.is_alive()]
+    return bool(_abandonadas)
+
+def liberar_navegador():
+    """Esquece as threads abandonadas (o driver que elas usavam foi descartado)"""
+    _abandonadas.clear()
+
+def executar_com_prazo(etapa: str, funcao, *args, **kwargs):
+    """Executa funcao numa thread auxiliar e desiste após PRAZOS[etapa] segundos.
+
+    A chamada travada continua na thread (daemon); nas etapas do navegador nenhuma
+    outra chamada ao driver começa enquanto ela não terminar ou o driver não for
+    recriado pela escada de recuperação.
+    """
+    prazo = PRAZOS[etapa]
+    if etapa in ETAPAS_NAVEGADOR and navegador_ocupado(ESPERA_ETAPA_ABANDONADA):
+        raise PrazoExcedido(etapa, ESPERA_ETAPA_ABANDONADA)
+    resultado = {}
+
+    def alvo():
+        try:
+            resultado["valor"] = funcao(*args, **kwargs)
+        except BaseException as e:
+            resultado["erro"] = e
+
+    thread = threading.Thread(target=alvo, name=f"tecanki-{etapa}", daemon=True)
+    thread.start()
+    thread.join(prazo)
+    if thread.is_alive():
+        if etapa in ETAPAS_NAVEGADOR:
+            _abandonadas.append(thread)
+        ritmo.registrar(etapa, prazo, erro=True)
+        raise PrazoExcedido(etapa, prazo)
+    if "erro" in resultado:
+        raise resultado["erro"]
+    return resultado.get("valor")
+
+# ═══════════════════════════════════════════════════════════════════════
+# GERENCIADOR DE COMENTÁRIOS DO FÓRUM
+# ═══════════════════════════════════════════════════════════════════════
+
+SNAPSHOT_JS = """
+const sel = arguments[0];
+const partes = arguments[1];
+const html = (s) => { const el = document.querySelector(s); return el ? el.outerHTML : null; };
+const texto = (raiz, s) => { const el = raiz.querySelector(s); return el ? el.innerText.trim() : null; };
+const resultado = {};
+if (partes.includes("questao")) resultado.questao = html("article[ng-if*='questao']");
+if (partes.includes("comentario")) resultado.comentario = html("div[tec-formatar-html='vm.comentario.textoComentario']");
+if (!partes.includes("forum")) return resultado;
+const forum = [];
+const container = document.querySelector(sel.container);
+if (container) {
+    for (const item of container.querySelectorAll(sel.comentario_item)) {
+        if (!item.querySelector(sel.comentario_visivel)) continue;
+        const foto = item.querySelector(sel.usuario_foto);
+        const corpo = item.querySelector(sel.comentario_texto);
+        forum.push({
+            votos: texto(item, sel.votos),
+            nome: texto(item, sel.usuario_nome),
+            foto: foto ? (foto.getAttribute("src") ? foto.src : "") : null,
+            pontos: texto(item, sel.usuario_pontos),
+            data: texto(item, sel.comentario_data),
+            texto_html: corpo ? corpo.innerHTML : ""
+        });
+    }
+}
+resultado.forum = forum;
+return resultado;
+"""
+
+class ForumManager:
+    """Gerencia extração e formatação de comentários do fórum TEC"""
+    
+    SELECTORS = {
+        "container": "ul.discussao-comentarios",
+        "comentario_item": "li",
+        "comentario_visivel": ".discussao-comentario-corpo",
+        "votos": ".discussao-comentario-nota-numero span",
+        "usuario_foto": ".post-cabecalho-perfil a img",
+        "usuario_nome": ".link-professor",
+        "usuario_pontos": ".votos .pontos",
+        "comentario_data": ".post-cabecalho-perfil-data",
+        "comentario_texto": ".discussao-comentario-post-texto",
+    }
+    
+    def __init__(self, driver):
+        self.driver = driver
+    
+    def abrir_forum(self) -> bool:
+        """Pressiona F para abrir comentários do fórum"""
+        try:
+            console.print("[cyan]Abrindo forum...[/cyan]")
+            with ritmo.acao("forum") as medicao:
+                body = self.driver.find_element(By.TAG_NAME, "body")
+                body.send_keys("f")
+                ritmo.pausa(DELAY_FORUM)
+                
+                try:
+                    WebDriverWait(self.driver, 5).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, self.SELECTORS["container"]))
+                    )
+                    ritmo.pausa(2.0)
+                    console.print("[green]Forum carregado[/green]")
+                    return True
+                except TimeoutException:
+                    medicao.descartar()
+                    console.print("[yellow]Forum não disponível[/yellow]")
+                    return False
+                
+        except Exception as e:
+            console.print(f"[yellow]Erro ao abrir forum: {e}[/yellow]")
+            return False
+    
+    def extrair_comentarios(self) -> list:
+        """Extrai todos os comentários visíveis do fórum"""
+        comentarios = []
+        
+        try:
+            with ritmo.acao("forum_itens") as medicao:
+                try:
+                    container = self.driver.find_element(By.CSS_SELECTOR, self.SELECTORS["container"])
+                except NoSuchElementException:
+                    # Fórum vazio: não é erro do site
+                    medicao.descartar()
+                    console.print("[yellow]Container de comentários não encontrado[/yellow]")
+                    return []
+                itens = container.find_elements(By.CSS_SELECTOR, self.SELECTORS["comentario_item"])
             
             if not itens:
                 console.print("[yellow]Nenhum comentário encontrado no forum[/yellow]")
@@ -476,7 +2075,7 @@ class ForumManager:
                     
                     comentario = self._extrair_dados_comentario(item)
                     
-                    if comentario and comentario.get('texto_html'):
+                    if comentario and comentario.texto_html:
                         comentarios.append(comentario)
                         console.print(f"[green]  Comentário {len(comentarios)} extraído[/green]")
                 
@@ -494,8 +2093,8 @@ class ForumManager:
             console.print(f"[yellow]Erro ao extrair comentários: {e}[/yellow]")
             return []
     
-    def _extrair_dados_comentario(self, elemento) -> dict:
-        """Extrai dados de um comentário individual"""
+    def _extrair_dados_comentario(self, elemento) -> Optional[ComentarioForum]:
+        """Extrai dados de um comentário individual (leitura local, fora do ritmo)"""
         try:
             try:
                 votos_elem = elemento.find_element(By.CSS_SELECTOR, self.SELECTORS["votos"])
@@ -531,33 +2130,64 @@ class ForumManager:
             
             try:
                 texto_elem = elemento.find_element(By.CSS_SELECTOR, self.SELECTORS["comentario_texto"])
-                texto_html = texto_elem.get_attribute("innerHTML") or ""
-                
-                if texto_html:
-                    soup = BeautifulSoup(texto_html, "lxml")
-                    for tag in soup.find_all(['script', 'style']):
-                        tag.decompose()
-                    texto_html = str(soup)
+                texto_html = sanitizar_html_comentario(texto_elem.get_attribute("innerHTML") or "")
             except:
                 texto_html = ""
             
             if not texto_html or not texto_html.strip():
                 return None
             
-            return {
-                "votos": votos,
-                "usuario": {
-                    "nome": usuario_nome,
-                    "foto": usuario_foto,
-                    "pontos": usuario_pontos
-                },
-                "data": data,
-                "texto_html": texto_html
-            }
+            return ComentarioForum(
+                votos=self._extrair_numero_votos(votos),
+                nome=usuario_nome,
+                foto=usuario_foto,
+                pontos=usuario_pontos,
+                data=data,
+                texto_html=texto_html
+            )
         
         except Exception:
             return None
     
+    def capturar_snapshot(self, partes: tuple = ("questao", "comentario", "forum")) -> dict:
+        """Uma única chamada ao navegador com as partes pedidas: questão, comentário oficial, itens do fórum"""
+        with ritmo.acao("snapshot"):
+            return self.driver.execute_script(SNAPSHOT_JS, self.SELECTORS, list(partes)) or {}
+    
+    def extrair_comentarios_snapshot(self) -> list:
+        """Extrai os comentários do fórum aberto com um único snapshot do DOM"""
+        try:
+            itens = self.capturar_snapshot(("forum",)).get("forum") or []
+        except Exception as e:
+            console.print(f"[yellow]Erro ao extrair comentários: {e}[/yellow]")
+            return []
+        
+        comentarios = [c for c in (self._comentario_de_snapshot(item) for item in itens) if c]
+        if comentarios:
+            console.print(f"[green]{len(comentarios)} comentários extraídos[/green]")
+        else:
+            console.print("[yellow]Nenhum comentário válido extraído[/yellow]")
+        return comentarios
+    
+    def _comentario_de_snapshot(self, item: dict) -> Optional[ComentarioForum]:
+        """Converte um item do snapshot em registro (mesmos padrões de _extrair_dados_comentario)"""
+        texto_html = sanitizar_html_comentario(item.get("texto_html") or "")
+        if not texto_html:
+            return None
+        
+        foto = item.get("foto") or ""
+        if "avatar.png" in foto:
+            foto = ""
+        
+        return ComentarioForum(
+            votos=self._extrair_numero_votos(item.get("votos") or "0"),
+            nome=item.get("nome") if item.get("nome") is not None else "Usuário",
+            foto=foto,
+            pontos=item.get("pontos") if item.get("pontos") is not None else "0 pontos",
+            data=item.get("data") or "",
+            texto_html=texto_html
+        )
+    
     def formatar_para_anki(self, comentarios: list) -> str:
         """Formata comentários do fórum para HTML do Anki"""
         if not comentarios:
@@ -566,14 +2196,10 @@ class ForumManager:
         html_parts = ['<div class="forum-comentarios" style="font-family: Arial, sans-serif; margin-top: 20px;">']
         html_parts.append('<h2 style="color: #2196F3; border-bottom: 3px solid #2196F3; padding-bottom: 8px; margin-bottom: 20px;">Comentários do Fórum ({} comentários)</h2>'.format(len(comentarios)))
         
-        comentarios_ordenados = sorted(
-            comentarios, 
-            key=lambda x: self._extrair_numero_votos(x['votos']), 
-            reverse=True
-        )
+        comentarios_ordenados = sorted(comentarios, key=lambda x: x.votos, reverse=True)
         
         for idx, c in enumerate(comentarios_ordenados, 1):
-            votos_num = self._extrair_numero_votos(c['votos'])
+            votos_num = c.votos
             if votos_num > 100:
                 cor_voto = '#4CAF50'
             elif votos_num > 20:
@@ -583,12 +2209,12 @@ class ForumManager:
             else:
                 cor_voto = '#F44336'
             
-            texto_processado = self._processar_texto_comentario(c['texto_html'])
+            texto_processado = c.texto_html
             
             # Avatar: iniciais ou foto
-            iniciais = self._gerar_iniciais(c['usuario']['nome'])
-            if c['usuario']['foto']:
-                avatar_html = f'<img src="{c["usuario"]["foto"]}" style="width: 40px; height: 40px; border-radius: 50%; margin-right: 12px; border: 2px solid #ddd;" onerror="this.outerHTML=\'<div style=\\\'width: 40px; height: 40px; border-radius: 50%; margin-right: 12px; background: linear-gradient(135deg, #1a73e8, #1557b0); color: white; display: flex; align-items: center; justify-content: center; font-weight: 600; font-size: 14px;\\\'>{iniciais}</div>\'">'
+            iniciais = self._gerar_iniciais(c.nome)
+            if c.foto:
+                avatar_html = f'<img src="{c.foto}" style="width: 40px; height: 40px; border-radius: 50%; margin-right: 12px; border: 2px solid #ddd;" onerror="this.outerHTML=\'<div style=\\\'width: 40px; height: 40px; border-radius: 50%; margin-right: 12px; background: linear-gradient(135deg, #1a73e8, #1557b0); color: white; display: flex; align-items: center; justify-content: center; font-weight: 600; font-size: 14px;\\\'>{iniciais}</div>\'">'
             else:
                 avatar_html = f'<div style="width: 40px; height: 40px; border-radius: 50%; margin-right: 12px; background: linear-gradient(135deg, #1a73e8, #1557b0); color: white; display: flex; align-items: center; justify-content: center; font-weight: 600; font-size: 14px;">{iniciais}</div>'
             
@@ -605,10 +2231,10 @@ class ForumManager:
                     {avatar_html}
                     <div style="flex: 1;">
                         <div>
-                            <strong style="color: #333; font-size: 15px;">{c['usuario']['nome']}</strong>
-                            <span style="color: #999; font-size: 12px; margin-left: 8px;">{c['data']}</span>
+                            <strong style="color: #333; font-size: 15px;">{c.nome}</strong>
+                            <span style="color: #999; font-size: 12px; margin-left: 8px;">{c.data}</span>
                         </div>
-                        <div style="color: #666; font-size: 12px;">{c['usuario']['pontos']}</div>
+                        <div style="color: #666; font-size: 12px;">{c.pontos}</div>
                     </div>
                     <div style="
                         background: {cor_voto}; 
@@ -620,7 +2246,7 @@ class ForumManager:
                         min-width: 50px;
                         text-align: center;
                     ">
-                        +{c['votos']}
+                        +{c.votos}
                     </div>
                 </div>
                 <div style="
@@ -646,30 +2272,6 @@ class ForumManager:
             return partes[0][0].upper()
         return "U"
     
-    def _processar_texto_comentario(self, html: str) -> str:
-        """Processa o HTML do texto do comentário"""
-        try:
-            soup = BeautifulSoup(html, "lxml")
-            
-            for img in soup.find_all('img'):
-                src = img.get('src', '')
-                if src.startswith('data:') and len(src) > MAX_IMG_URL_CHARS:
-                    img.decompose()
-                    continue
-                
-                style = img.get('style', '')
-                img['style'] = f"{style}; max-width: 100%; height: auto; display: block; margin: 10px 0; border-radius: 4px;"
-            
-            for script in soup.find_all('script'):
-                script.decompose()
-            
-            body = soup.body if soup.body else soup
-            conteudo = ''.join(str(child) for child in body.children)
-            
-            return conteudo.strip()
-        except:
-            return html
-    
     def _extrair_numero_votos(self, texto_votos: str) -> int:
         """Extrai número inteiro dos votos"""
         try:
@@ -681,9 +2283,10 @@ class ForumManager:
     def fechar_forum(self):
         """Fecha o fórum (pressiona ESC)"""
         try:
-            body = self.driver.find_element(By.TAG_NAME, "body")
-            body.send_keys(Keys.ESCAPE)
-            time.sleep(1.0)
+            with ritmo.acao("fechar_forum"):
+                body = self.driver.find_element(By.TAG_NAME, "body")
+                body.send_keys(Keys.ESCAPE)
+                ritmo.pausa(1.0)
         except Exception:
             pass
 
@@ -691,15 +2294,217 @@ class ForumManager:
 # NAVEGADOR TEC
 # ═══════════════════════════════════════════════════════════════════════
 
+def argumentos_navegador(modo: str, perfil: str) -> list:
+    """Argumentos de linha de comando do Chrome/Edge conforme o modo (normal/enxuto/headless)"""
+    args = []
+    if modo == "headless":
+        largura, altura = HEADLESS_VIEWPORT
+        args.append("--headless=new")
+        args.append(f"--window-size={largura},{altura}")
+    else:
+        args.append("--start-maximized")
+    if modo in ("enxuto", "headless"):
+        # Imagens não são baixadas nem decodificadas; o src continua no HTML capturado
+        args.append("--blink-settings=imagesEnabled=false")
+        args.append("--disable-extensions")
+    args.append(f"--user-data-dir={perfil}")
+    args.append("--profile-directory=Default")
+    return args
+
+def daemon_ativo() -> bool:
+    """Verifica se há navegador persistente respondendo na porta de depuração"""
+    try:
+        resp = requests.get(f"http://127.0.0.1:{DAEMON_PORTA}/json/version", timeout=1)
+        return resp.ok
+    except requests.RequestException:
+        return False
+
+def _localizar_navegador() -> Optional[str]:
+    """Localiza o executável do Chrome (ou Edge) instalado"""
+    for nome in ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome", "msedge"):
+        caminho = shutil.which(nome)
+        if caminho:
+            return caminho
+
+    candidatos = [
+        "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+        "/Applications/Microsoft Edge.app/Contents/MacOS/Microsoft Edge",
+    ]
+    for var in ("PROGRAMFILES", "PROGRAMFILES(X86)", "LOCALAPPDATA"):
+        base = os.environ.get(var)
+        if base:
+            candidatos.append(os.path.join(base, "Google", "Chrome", "Application", "chrome.exe"))
+            candidatos.append(os.path.join(base, "Microsoft", "Edge", "Application", "msedge.exe"))
+    for caminho in candidatos:
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+def iniciar_daemon(modo: str = "normal"):
+    """Abre um navegador de longa duração com depuração remota no perfil da sessão"""
+    if daemon_ativo():
+        console.print(f"[green]Navegador persistente já ativo na porta {DAEMON_PORTA}[/green]")
+        return
+
+    executavel = _localizar_navegador()
+    if not executavel:
+        raise Exception("Chrome/Edge não encontrado para iniciar o navegador persistente")
+
+    if not os.path.exists(PERFIL_DIR):
+        os.makedirs(PERFIL_DIR)
+
+    args = [executavel, f"--remote-debugging-port={DAEMON_PORTA}", "--no-first-run", "--no-default-browser-check"]
+    args.extend(argumentos_navegador(modo, PERFIL_DIR))
+    args.append("https://www.tecconcursos.com.br/questoes")
+
+    opcoes = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "stdin": subprocess.DEVNULL}
+    if os.name == "nt":
+        opcoes["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        opcoes["start_new_session"] = True
+    processo = subprocess.Popen(args, **opcoes)
+
+    with open(DAEMON_PID_ARQUIVO, "w") as f:
+        f.write(str(processo.pid))
+
+    limite = time.time() + DAEMON_TIMEOUT_INICIO
+    while time.time() < limite:
+        if daemon_ativo():
+            console.print(f"[green]Navegador persistente iniciado (pid {processo.pid}, porta {DAEMON_PORTA})[/green]")
+            return
+        time.sleep(0.5)
+    raise Exception("Navegador persistente não respondeu na porta de depuração")
+
+def _nome_processo(pid: int) -> Optional[str]:
+    """Nome do executável do processo pid (None se não existir)"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).name()
+        except psutil.Error:
+            return None
+    try:
+        if os.name == "nt":
+            saida = subprocess.run(["tasklist", "/FI", f"PID eq {pid}", "/FO", "CSV", "/NH"],
+                                   capture_output=True, text=True).stdout
+            m = re.match(r'\s*"([^"]+)"', saida)
+            return m.group(1) if m else None
+        saida = subprocess.run(["ps", "-p", str(pid), "-o", "comm="], capture_output=True, text=True).stdout
+        return saida.strip() or None
+    except OSError:
+        return None
+
+def parar_daemon():
+    """Encerra o navegador persistente (só se o pid registrado ainda for o Chrome/Edge dele)"""
+    if not os.path.exists(DAEMON_PID_ARQUIVO):
+        console.print("[yellow]Nenhum navegador persistente registrado[/yellow]")
+        return
+
+    try:
+        try:
+            with open(DAEMON_PID_ARQUIVO) as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            pid = 0
+        # pid 0 (ou negativo) em os.kill atingiria o grupo de processos inteiro
+        if pid <= 0:
+            console.print("[yellow]Arquivo de pid inválido - registro removido[/yellow]")
+            return
+        if not daemon_ativo():
+            console.print(f"[yellow]Navegador persistente inativo - pid {pid} obsoleto, registro removido[/yellow]")
+            return
+        nome = _nome_processo(pid)
+        if not nome or not any(n in nome.lower() for n in ("chrome", "chromium", "msedge")):
+            console.print(f"[yellow]Processo {pid} não é o navegador persistente ({nome or 'não encontrado'}) - nada encerrado[/yellow]")
+            return
+
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/PID", str(pid), "/T", "/F"],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.kill(pid, signal.SIGTERM)
+        console.print(f"[green]Navegador persistente encerrado (pid {pid})[/green]")
+    except OSError as e:
+        console.print(f"[yellow]Processo {pid} não encontrado: {e}[/yellow]")
+    finally:
+        os.remove(DAEMON_PID_ARQUIVO)
+
+def status_daemon():
+    """Mostra se o navegador persistente está ativo"""
+    if daemon_ativo():
+        console.print(f"[green]Navegador persistente ativo na porta {DAEMON_PORTA}[/green]")
+    else:
+        console.print("[yellow]Navegador persistente inativo[/yellow]")
+
 class NavegadorTEC:
     """Controla navegação no site TEC Concursos"""
     
-    def __init__(self):
+    def __init__(self, modo: str = "normal"):
         self.driver = None
         self.forum_manager = None
+        self.modo = modo
+        self.tempos_carga = []
+        self.ultima_carga = None   # None: carga da última navegação não medida
+        self.anexado = False
+        self.recuperacoes = {"paineis": 0, "recarga": 0, "driver": 0}
+        self.reciclagens = 0
+        self.questoes_ciclo = 0
+        self.inicio_ciclo = 0
+    
+    def _configurar_opcoes(self, options, perfil: str):
+        """Argumentos comuns a Chrome e Edge, conforme o modo (normal/enxuto/headless)"""
+        for arg in argumentos_navegador(self.modo, perfil):
+            options.add_argument(arg)
+    
+    def _aplicar_bloqueios(self):
+        """Bloqueia anúncios, analytics e tipos de recurso configurados via CDP"""
+        if self.modo not in ("enxuto", "headless"):
+            return
+        padroes = list(BLOQUEIO_URLS)
+        for tipo in BLOQUEIO_TIPOS_ATIVOS:
+            padroes.extend(BLOQUEIO_TIPOS.get(tipo, []))
+        try:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": padroes})
+            console.print(f"[green]Modo enxuto: {len(padroes)} padrões bloqueados[/green]")
+        except Exception as e:
+            console.print(f"[yellow]Não foi possível aplicar bloqueios: {e}[/yellow]")
+    
+    def _configurar_timeouts(self):
+        """Limita carga de página e scripts aos prazos configurados"""
+        self.driver.set_page_load_timeout(PRAZOS["navegacao"])
+        self.driver.set_script_timeout(PRAZOS["captura"])
+    
+    def _anexar_daemon(self) -> bool:
+        """Conecta ao navegador persistente via debuggerAddress, se estiver ativo"""
+        if not daemon_ativo():
+            return False
+        
+        endereco = f"127.0.0.1:{DAEMON_PORTA}"
+        tentativas = [
+            (webdriver.ChromeOptions, ChromeDriverManager, webdriver.Chrome),
+            (webdriver.EdgeOptions, EdgeChromiumDriverManager, webdriver.Edge),
+        ]
+        for classe_opcoes, gerenciador, classe_driver in tentativas:
+            try:
+                options = classe_opcoes()
+                options.add_experimental_option("debuggerAddress", endereco)
+                service = Service(gerenciador().install())
+                self.driver = classe_driver(service=service, options=options)
+                self._configurar_timeouts()
+                self.anexado = True
+                console.print(f"[green]Conectado ao navegador persistente ({endereco})[/green]")
+                self._aplicar_bloqueios()
+                self.forum_manager = ForumManager(self.driver)
+                return True
+            except Exception as e:
+                console.print(f"[yellow]Não foi possível conectar ao navegador persistente: {e}[/yellow]")
+        return False
     
     def iniciar(self):
-        """Inicia navegador com sessão salva"""
+        """Inicia navegador com sessão salva (ou conecta ao navegador persistente)"""
+        if self._anexar_daemon():
+            return
+        
         console.print("[cyan]Iniciando navegador...[/cyan]")
         
         # Cria diretório de perfil se não existir
@@ -711,17 +2516,15 @@ class NavegadorTEC:
         
         # Opções do Chrome com perfil persistente
         options = webdriver.ChromeOptions()
-        options.add_argument("--start-maximized")
-        options.add_argument(f"--user-data-dir={PERFIL_DIR}")
-        options.add_argument("--profile-directory=Default")
+        self._configurar_opcoes(options, PERFIL_DIR)
         options.add_experimental_option("excludeSwitches", ["enable-logging"])
         
         try:
             service = Service(ChromeDriverManager().install())
             self.driver = webdriver.Chrome(service=service, options=options)
-            self.driver.set_page_load_timeout(999999)
-            self.driver.set_script_timeout(999999)
+            self._configurar_timeouts()
             console.print("[green]Chrome iniciado[/green]")
+            self._aplicar_bloqueios()
             self.forum_manager = ForumManager(self.driver)
         except Exception as chrome_error:
             console.print(f"[yellow]Chrome falhou: {chrome_error}[/yellow]")
@@ -732,36 +2535,58 @@ class NavegadorTEC:
                     os.makedirs(edge_perfil)
                 
                 edge_options = webdriver.EdgeOptions()
-                edge_options.add_argument("--start-maximized")
-                edge_options.add_argument(f"--user-data-dir={edge_perfil}")
-                edge_options.add_argument("--profile-directory=Default")
+                self._configurar_opcoes(edge_options, edge_perfil)
                 
                 service = Service(EdgeChromiumDriverManager().install())
                 self.driver = webdriver.Edge(service=service, options=edge_options)
-                self.driver.set_page_load_timeout(999999)
-                self.driver.set_script_timeout(999999)
+                self._configurar_timeouts()
                 console.print("[green]Edge iniciado[/green]")
+                self._aplicar_bloqueios()
                 self.forum_manager = ForumManager(self.driver)
             except Exception as e:
                 raise Exception(f"Não foi possível iniciar navegador: {e}")
     
-    def navegar_tec(self):
-        """Navega para o TEC"""
+    def navegar_tec(self, url_inicial: Optional[str] = None, lista: bool = False):
+        """Navega para o TEC (no modo headless, direto para url_inicial).
+
+        No modo lista as questões são abertas pela URL depois; aqui só se garante o login.
+        """
+        if self.anexado and self.validar_questao() and not url_inicial and not lista:
+            console.print("[green]Navegador persistente já está numa questão[/green]")
+            return
+        
         console.print("[cyan]Acessando TEC Concursos...[/cyan]")
-        self.driver.get("https://www.tecconcursos.com.br/questoes")
-        time.sleep(3)
+        with ritmo.acao("abrir_tec"):
+            self.driver.get("https://www.tecconcursos.com.br/questoes")
+            ritmo.pausa(3)
         
         # Verifica se já está logado
+        logado = False
         try:
             self.driver.find_element(By.CSS_SELECTOR, "[class*='usuario'], [class*='perfil'], .avatar")
             console.print("[green]Sessão ativa - já está logado[/green]")
+            logado = True
         except:
-            console.print("[yellow]Faça login no TEC Concursos[/yellow]")
+            if self.modo == "headless":
+                console.print("[red]Sessão não logada - execute uma vez sem headless para fazer login[/red]")
+            else:
+                console.print("[yellow]Faça login no TEC Concursos[/yellow]")
+        
+        if url_inicial:
+            with ritmo.acao("abrir_questao"):
+                self.driver.get(url_inicial)
+                ritmo.pausa(DELAY_NAVEGACAO)
+            return
+        
+        if lista:
+            if not logado and self.modo != "headless":
+                input("\n[Pressione ENTER depois de fazer login] ")
+            return
         
         input("\n[Pressione ENTER quando estiver numa questão] ")
     
     def validar_questao(self) -> bool:
-        """Valida se está numa página de questão"""
+        """Valida se está numa página de questão (leitura local, fora do ritmo)"""
         try:
             self.driver.find_element(By.CSS_SELECTOR, "article[ng-if*='questao']")
             return True
@@ -771,27 +2596,41 @@ class NavegadorTEC:
     def capturar_questao(self) -> Optional[str]:
         """Captura HTML da questão"""
         try:
-            elemento = self.driver.find_element(By.CSS_SELECTOR, "article[ng-if*='questao']")
-            return elemento.get_attribute("outerHTML")
+            with ritmo.acao("captura"):
+                elemento = self.driver.find_element(By.CSS_SELECTOR, "article[ng-if*='questao']")
+                return elemento.get_attribute("outerHTML")
         except:
             return None
-    
+
+    def obter_id_questao(self, html_questao: str = "") -> Optional[str]:
+        """Identifica o ID TEC da questão atual pela URL (links no HTML podem ser de outras questões).
+        Leitura local, fora do ritmo"""
+        try:
+            m = re.search(r"/questoes/(\d+)", self.driver.current_url or "")
+            if m:
+                return m.group(1)
+        except Exception:
+            pass
+        return None
+
     def abrir_comentario(self) -> bool:
         """Abre o comentário (tecla O)"""
         try:
             console.print("[cyan]Abrindo comentário oficial...[/cyan]")
-            self.driver.find_element(By.TAG_NAME, "body").send_keys("o")
-            time.sleep(DELAY_COMENTARIO)
-            
-            try:
-                WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "article[ng-if*=\"comentario\"]"))
-                )
-                console.print("[green]Comentário oficial aberto[/green]")
-                return True
-            except TimeoutException:
-                console.print("[yellow]Comentário oficial não disponível[/yellow]")
-                return False
+            with ritmo.acao("comentario") as medicao:
+                self.driver.find_element(By.TAG_NAME, "body").send_keys("o")
+                ritmo.pausa(DELAY_COMENTARIO)
+                
+                try:
+                    WebDriverWait(self.driver, 5).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, "article[ng-if*=\"comentario\"]"))
+                    )
+                    console.print("[green]Comentário oficial aberto[/green]")
+                    return True
+                except TimeoutException:
+                    medicao.descartar()
+                    console.print("[yellow]Comentário oficial não disponível[/yellow]")
+                    return False
         except Exception as e:
             console.print(f"[yellow]Erro ao abrir comentário: {e}[/yellow]")
             return False
@@ -799,27 +2638,32 @@ class NavegadorTEC:
     def capturar_comentario(self) -> str:
         """Captura o HTML do comentário"""
         try:
-            elemento = self.driver.find_element(By.CSS_SELECTOR, "div[tec-formatar-html='vm.comentario.textoComentario']")
-            return elemento.get_attribute("outerHTML")
+            with ritmo.acao("captura_comentario") as medicao:
+                try:
+                    elemento = self.driver.find_element(By.CSS_SELECTOR, "div[tec-formatar-html='vm.comentario.textoComentario']")
+                except NoSuchElementException:
+                    # Questão sem comentário oficial: não é erro do site
+                    medicao.descartar()
+                    return COMENTARIO_INDISPONIVEL
+                return elemento.get_attribute("outerHTML")
         except:
             return COMENTARIO_INDISPONIVEL
     
-    def capturar_comentarios_forum(self) -> str:
-        """Captura comentários do fórum"""
+    def capturar_registros_forum(self) -> list:
+        """Captura comentários do fórum como registros (lista vazia se indisponível)"""
         if not self.forum_manager:
-            return FORUM_INDISPONIVEL
+            return []
         
         try:
             if not self.forum_manager.abrir_forum():
-                return FORUM_INDISPONIVEL
-            
-            comentarios = self.forum_manager.extrair_comentarios()
-            self.forum_manager.fechar_forum()
+                return []
             
-            if comentarios:
-                return self.forum_manager.formatar_para_anki(comentarios)
+            if CAPTURA_SNAPSHOT:
+                comentarios = self.forum_manager.extrair_comentarios_snapshot()
             else:
-                return FORUM_INDISPONIVEL
+                comentarios = self.forum_manager.extrair_comentarios()
+            self.forum_manager.fechar_forum()
+            return comentarios
         
         except Exception as e:
             console.print(f"[yellow]Erro ao capturar forum: {e}[/yellow]")
@@ -827,38 +2671,248 @@ class NavegadorTEC:
                 self.forum_manager.fechar_forum()
             except:
                 pass
-            return FORUM_INDISPONIVEL
+            return []
     
     def responder_questao_c(self):
         """Responde a questão com alternativa C e confirma"""
         try:
-            body = self.driver.find_element(By.TAG_NAME, "body")
-            body.send_keys("c")
-            time.sleep(DELAY_RESPOSTA)
-            body.send_keys(Keys.RETURN)
-            time.sleep(DELAY_RESPOSTA)
+            with ritmo.acao("resposta"):
+                body = self.driver.find_element(By.TAG_NAME, "body")
+                body.send_keys("c")
+                ritmo.pausa(DELAY_RESPOSTA)
+                body.send_keys(Keys.RETURN)
+                ritmo.pausa(DELAY_RESPOSTA)
             console.print("[green]Questão respondida (C)[/green]")
         except Exception as e:
             console.print(f"[yellow]Não foi possível responder: {e}[/yellow]")
     
     def navegar_proxima(self, modo: str):
         """Navega para próxima questão"""
+        inicio = time.time()
+        self.ultima_carga = None
         try:
-            body = self.driver.find_element(By.TAG_NAME, "body")
-            
-            if modo == "proxima":
-                body.send_keys(Keys.ARROW_RIGHT)
-            else:
-                body.send_keys("l")
-            
-            time.sleep(DELAY_NAVEGACAO)
-            return self.validar_questao()
+            with ritmo.acao("navegacao") as medicao:
+                body = self.driver.find_element(By.TAG_NAME, "body")
+                try:
+                    anterior = self.driver.find_element(By.CSS_SELECTOR, "article[ng-if*='questao']")
+                except NoSuchElementException:
+                    anterior = None
+                
+                if modo == "proxima":
+                    body.send_keys(Keys.ARROW_RIGHT)
+                else:
+                    body.send_keys("l")
+                
+                # Tempo de resposta = até a questão anterior sair do DOM; carga = até a nova
+                # estar presente (sem a pausa DELAY_RESPOSTA, lida pela detecção de deriva).
+                # O prazo não acompanha o ritmo: com a taxa alta ele cairia abaixo de uma
+                # troca normal de página e a questão antiga seria capturada de novo
+                if anterior is not None:
+                    try:
+                        espera = WebDriverWait(self.driver, ESPERA_PROXIMA)
+                        espera.until(EC.staleness_of(anterior))
+                        espera.until(EC.presence_of_element_located((By.CSS_SELECTOR, "article[ng-if*='questao']")))
+                        self.ultima_carga = time.time() - inicio
+                        ritmo.pausa(DELAY_RESPOSTA)
+                    except TimeoutException:
+                        # A questão não trocou: falha (o ritmo recua) e nada é recapturado
+                        medicao.falhou()
+                        return False
+                else:
+                    ritmo.pausa(DELAY_NAVEGACAO)
+                    medicao.descartar()
+                
+                ok = self.validar_questao()
+                if not ok:
+                    medicao.falhou()
+                elif self.ultima_carga is not None:
+                    self.tempos_carga.append(self.ultima_carga)
+                return ok
         except:
             return False
     
+    def url_atual(self) -> Optional[str]:
+        """URL exata da questão atual, para voltar a ela mantendo a lista/filtro do caderno
+        (a canônica pelo ID só é usada no modo lista)"""
+        try:
+            return executar_com_prazo("captura", lambda: self.driver.current_url) or None
+        except Exception:
+            return None
+    
+    def ir_para(self, url: str) -> bool:
+        """Abre diretamente a URL de uma questão.
+
+        A carga (self.ultima_carga) vai do get até a questão estar presente, sem a espera
+        do token nem a pausa DELAY_NAVEGACAO: um recuo do ritmo não parece deriva de carga.
+        """
+        self.ultima_carga = None
+        with ritmo.acao("abrir_questao") as medicao:
+            inicio = time.time()
+            self.driver.get(url)
+            try:
+                WebDriverWait(self.driver, TIMEOUT_ELEMENTO).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "article[ng-if*='questao']"))
+                )
+                self.ultima_carga = time.time() - inicio
+            except TimeoutException:
+                pass
+            ritmo.pausa(DELAY_NAVEGACAO)
+            ok = self.validar_questao()
+            if not ok:
+                medicao.falhou()
+            return ok
+    
+    def _fechar_paineis(self) -> bool:
+        with ritmo.acao("paineis") as medicao:
+            body = self.driver.find_element(By.TAG_NAME, "body")
+            body.send_keys(Keys.ESCAPE)
+            ritmo.pausa(0.5)
+            body.send_keys(Keys.ESCAPE)
+            ritmo.pausa(0.5)
+            ok = self.validar_questao()
+            if not ok:
+                medicao.falhou()
+            return ok
+    
+    def _recarregar(self, url: Optional[str]) -> bool:
+        if url:
+            return self.ir_para(url)
+        with ritmo.acao("recarga") as medicao:
+            self.driver.refresh()
+            ritmo.pausa(DELAY_NAVEGACAO)
+            ok = self.validar_questao()
+            if not ok:
+                medicao.falhou()
+            return ok
+    
+    def _recriar_driver(self, url: Optional[str]) -> bool:
+        """Descarta o driver atual (mesmo travado) e abre outro no mesmo perfil"""
+        antigo = self.driver
+        try:
+            if navegador_ocupado():
+                raise PrazoExcedido("navegacao", 0)
+            executar_com_prazo("navegacao", self.fechar)
+        except Exception:
+            try:
+                antigo.service.process.kill()
+            except Exception:
+                pass
+        liberar_navegador()
+        self.driver = None
+        self.anexado = False
+        self.questoes_ciclo = 0
+        self.inicio_ciclo = len(self.tempos_carga)
+        self.iniciar()
+        return self._recarregar(url) if url else self.validar_questao()
+    
+    def memoria_mb(self) -> Tuple[Optional[float], float]:
+        """Memória do navegador em MB e o limite correspondente (RSS via psutil ou heap JS).
+        Leitura local, fora do ritmo"""
+        if psutil is not None and not self.anexado:
+            try:
+                raiz = psutil.Process(self.driver.service.process.pid)
+                total = 0
+                for processo in [raiz] + raiz.children(recursive=True):
+                    try:
+                        total += processo.memory_info().rss
+                    except psutil.Error:
+                        pass
+                return total / 1e6, RECICLAR_MEMORIA_MB
+            except Exception:
+                pass
+        try:
+            heap = self.driver.execute_script(
+                "return performance.memory ? performance.memory.usedJSHeapSize : null")
+            return (heap / 1e6 if heap else None), RECICLAR_HEAP_MB
+        except Exception:
+            return None, RECICLAR_HEAP_MB
+    
+    def _motivo_reciclagem(self) -> Optional[str]:
+        """Por que o navegador deve ser reciclado agora (None se não deve)"""
+        if self.anexado or not self.questoes_ciclo:
+            return None
+        if RECICLAR_A_CADA and self.questoes_ciclo >= RECICLAR_A_CADA:
+            return f"{self.questoes_ciclo} questões no ciclo"
+        
+        tempos = self.tempos_carga[self.inicio_ciclo:]
+        if len(tempos) >= 2 * RECICLAR_JANELA:
+            inicial = sorted(tempos[:RECICLAR_JANELA])[RECICLAR_JANELA // 2]
+            recente = sorted(tempos[-RECICLAR_JANELA:])[RECICLAR_JANELA // 2]
+            if inicial > 0 and recente > inicial * RECICLAR_DERIVA_CARGA:
+                return f"carga subiu de {inicial:.2f}s para {recente:.2f}s"
+        
+        if self.questoes_ciclo % RECICLAR_VERIFICAR_A_CADA == 0:
+            memoria, limite = self.memoria_mb()
+            if memoria and memoria > limite:
+                return f"memória {memoria:.0f} MB (limite {limite} MB)"
+        return None
+    
+    def reciclar_se_necessario(self, url: Optional[str]):
+        """Reinicia o driver no mesmo perfil e volta para url quando um limite é atingido"""
+        motivo = self._motivo_reciclagem()
+        if not motivo:
+            return
+        console.print(f"[cyan]Reciclando navegador ({motivo})...[/cyan]")
+        try:
+            self._recriar_driver(url)
+            self.reciclagens += 1
+            console.print("[green]Navegador reciclado[/green]")
+        except Exception as e:
+            console.print(f"[yellow]Falha ao reciclar navegador: {e}[/yellow]")
+    
+    def recuperar(self, url: Optional[str]) -> bool:
+        """Escada de recuperação: fechar painéis (ESC) → recarregar questão → recriar driver"""
+        degraus = [
+            ("paineis", "fechando painéis", lambda: executar_com_prazo("navegacao", self._fechar_paineis)),
+            ("recarga", "recarregando questão", lambda: executar_com_prazo("navegacao", self._recarregar, url)),
+            ("driver", "recriando navegador", lambda: self._recriar_driver(url)),
+        ]
+        if navegador_ocupado(ESPERA_ETAPA_ABANDONADA):
+            # Uma etapa abandonada ainda usa o driver: só recriá-lo é seguro
+            degraus = degraus[-1:]
+        for chave, descricao, degrau in degraus:
+            console.print(f"[yellow]Recuperação: {descricao}...[/yellow]")
+            try:
+                if degrau():
+                    self.recuperacoes[chave] += 1
+                    console.print("[green]Recuperado[/green]")
+                    return True
+            except Exception as e:
+                console.print(f"[yellow]Falhou: {e}[/yellow]")
+        return False
+    
+    def abrir_questao(self, url: str) -> bool:
+        """Abre a URL de uma questão (modo lista), reciclando o navegador se preciso"""
+        self.reciclar_se_necessario(None)
+        ok = executar_com_prazo("navegacao", self.ir_para, url)
+        if ok:
+            if self.ultima_carga is not None:
+                self.tempos_carga.append(self.ultima_carga)
+            self.questoes_ciclo += 1
+        return ok
+    
+    def navegar_com_recuperacao(self, modo: str) -> bool:
+        """Navega para a próxima questão; se falhar, recupera e tenta mais uma vez"""
+        url = self.url_atual()
+        self.reciclar_se_necessario(url)
+        for tentativa in range(2):
+            try:
+                if executar_com_prazo("navegacao", self.navegar_proxima, modo):
+                    self.questoes_ciclo += 1
+                    return True
+            except Exception as e:
+                console.print(f"[yellow]Navegação falhou: {e}[/yellow]")
+            if tentativa == 0 and not self.recuperar(url):
+                return False
+        return False
+    
     def fechar(self):
-        """Fecha o navegador"""
-        if self.driver:
+        """Fecha o navegador (conectado ao persistente: só encerra o driver)"""
+        if not self.driver:
+            return
+        if self.anexado:
+            self.driver.service.stop()
+        else:
             self.driver.quit()
 
 # ═══════════════════════════════════════════════════════════════════════
@@ -873,27 +2927,112 @@ def exibir_titulo():
         border_style="cyan"
     ))
 
-def solicitar_config() -> Tuple[str, int, str, bool]:
+def solicitar_config() -> dict:
     """Solicita configurações do usuário"""
     console.print("\n[bold yellow]CONFIGURAÇÃO[/bold yellow]\n")
     
     deck = Prompt.ask("[cyan]Nome do deck[/cyan]")
-    quantidade_input = Prompt.ask("[cyan]Quantas questões processar?[/cyan]")
-    quantidade = int(quantidade_input) if quantidade_input.strip() else 10
+    
+    console.print("\n[cyan]Modo de navegação:[/cyan]")
+    console.print("  [1] Próxima sequencial (não responde)")
+    console.print("  [2] Aleatória não resolvida (responde C)")
+    console.print("  [3] Lista de IDs/URLs em arquivo (acesso direto)")
+    
+    modo = Prompt.ask("[cyan]Escolha[/cyan]", choices=["1", "2", "3"], default="1")
+    modo_nav = {"1": "proxima", "2": "aleatoria", "3": "lista"}[modo]
+    
+    ids = []
+    progresso = None
+    if modo_nav == "lista":
+        ids, progresso = solicitar_lista()
+        quantidade = len(ids)
+    else:
+        quantidade_input = Prompt.ask("[cyan]Quantas questões processar?[/cyan]")
+        quantidade = int(quantidade_input) if quantidade_input.strip() else 10
     
     console.print("\n[cyan]Incluir comentários do fórum?[/cyan]")
     console.print("  [dim]Captura todos os comentários dos usuários com imagens e formatação[/dim]")
     incluir_forum_input = Prompt.ask("[cyan]Incluir forum? (s/n)[/cyan]", choices=["s", "n"], default="s")
     incluir_forum = (incluir_forum_input.lower() == "s")
     
-    console.print("\n[cyan]Modo de navegação:[/cyan]")
-    console.print("  [1] Próxima sequencial (não responde)")
-    console.print("  [2] Aleatória não resolvida (responde C)")
+    forum_json = False
+    if incluir_forum:
+        console.print("\n[cyan]Formato do fórum:[/cyan]")
+        console.print("  [1] HTML pronto no verso (modelo Basic)")
+        console.print("  [2] JSON compacto renderizado pelo cartão (modelo TECANKI)")
+        forum_json = Prompt.ask("[cyan]Escolha[/cyan]", choices=["1", "2"], default="1") == "2"
+    
+    console.print("\n[cyan]Destino dos cards:[/cyan]")
+    console.print("  [1] Anki aberto (AnkiConnect)")
+    console.print("  [2] Arquivo .apkg (não precisa do Anki aberto)")
+    
+    destino_input = Prompt.ask("[cyan]Escolha[/cyan]", choices=["1", "2"], default="1")
+    destino = "anki" if destino_input == "1" else "apkg"
+    
+    console.print("\n[cyan]Modo do navegador:[/cyan]")
+    console.print("  [1] Normal")
+    console.print("  [2] Enxuto (bloqueia anúncios, fontes e imagens)")
+    console.print("  [3] Enxuto headless (requer sessão já logada)")
     
-    modo = Prompt.ask("[cyan]Escolha[/cyan]", choices=["1", "2"], default="1")
-    modo_nav = "proxima" if modo == "1" else "aleatoria"
+    navegador_input = Prompt.ask("[cyan]Escolha[/cyan]", choices=["1", "2", "3"], default="1")
+    navegador = {"1": "normal", "2": "enxuto", "3": "headless"}[navegador_input]
+    url_inicial = None
+    if navegador == "headless" and not ids:
+        url_inicial = Prompt.ask("[cyan]URL da primeira questão[/cyan]")
     
-    return deck, quantidade, modo_nav, incluir_forum
+    atualizar = False
+    if destino == "anki":
+        console.print("\n[cyan]Atualizar cards já criados?[/cyan]")
+        console.print("  [dim]Questões já conhecidas só são reenviadas se o conteúdo mudou[/dim]")
+        atualizar_input = Prompt.ask("[cyan]Modo atualização? (s/n)[/cyan]", choices=["s", "n"], default="n")
+        atualizar = (atualizar_input.lower() == "s")
+    
+    return {
+        "deck": deck,
+        "quantidade": quantidade,
+        "modo": modo_nav,
+        "incluir_forum": incluir_forum,
+        "forum_json": forum_json,
+        "destino": destino,
+        "atualizar": atualizar,
+        "navegador": navegador,
+        "url_inicial": url_inicial,
+        "ids": ids,
+        "progresso": progresso,
+    }
+
+def solicitar_lista() -> Tuple[list, ProgressoLista]:
+    """Lê o arquivo de IDs, aplica a divisão entre workers e oferece retomar"""
+    while True:
+        caminho = Prompt.ask("[cyan]Arquivo com IDs ou URLs (um por linha)[/cyan]").strip().strip('"')
+        if os.path.exists(caminho):
+            break
+        console.print(f"[red]Arquivo não encontrado: {caminho}[/red]")
+    
+    ids, duplicados = ler_lista_ids(caminho)
+    console.print(f"[green]{len(ids)} questões na lista ({duplicados} duplicadas removidas)[/green]")
+    
+    divisao = Prompt.ask("[cyan]Parte da lista para este worker (ex.: 2/4)[/cyan]", default="1/1")
+    m = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", divisao)
+    parte, partes = (int(m.group(1)), int(m.group(2))) if m else (1, 1)
+    if not 1 <= parte <= partes:
+        parte, partes = 1, 1
+    sufixo = ""
+    if partes > 1:
+        ids = dividir_lista(ids, parte, partes)
+        sufixo = f".parte{parte}de{partes}"
+        console.print(f"[green]Parte {parte}/{partes}: {len(ids)} questões[/green]")
+    
+    progresso = ProgressoLista(f"{os.path.splitext(caminho)[0]}{sufixo}.progresso.json")
+    progresso.carregar()
+    inicio = progresso.primeiro_pendente(ids)
+    if progresso.resultados and 0 < inicio:
+        console.print(f"[yellow]Execução anterior processou até a questão {inicio} de {len(ids)}[/yellow]")
+        retomar = Prompt.ask("[cyan]Retomar do primeiro ID não processado? (s/n)[/cyan]", choices=["s", "n"], default="s")
+        if retomar == "s":
+            ids = ids[inicio:]
+    
+    return ids, progresso
 
 def exibir_relatorio(stats: dict):
     """Exibe relatório final"""
@@ -905,55 +3044,321 @@ def exibir_relatorio(stats: dict):
     tabela.add_row("Sucesso", f"[green]{stats['sucesso']}[/green]")
     tabela.add_row("Sem comentário", f"[yellow]{stats['sem_comentario']}[/yellow]")
     tabela.add_row("Sem forum", f"[yellow]{stats['sem_forum']}[/yellow]")
+    if stats.get('atualizar'):
+        tabela.add_row("Atualizadas", f"[green]{stats['atualizadas']}[/green]")
+        tabela.add_row("Inalteradas", f"[dim]{stats['inalteradas']}[/dim]")
+    if stats.get('duplicadas'):
+        acao = "puladas" if DUPLICATAS_ACAO == "pular" else f"marcadas com '{DUPLICATAS_TAG}'"
+        tabela.add_row("Quase duplicatas", f"[yellow]{stats['duplicadas']}[/yellow] ({acao})")
+    if stats.get('nao_encontradas'):
+        tabela.add_row("Não encontradas", f"[yellow]{stats['nao_encontradas']}[/yellow]")
     tabela.add_row("Erros", f"[red]{stats['erros']}[/red]")
+    if stats.get('retentadas_ok'):
+        tabela.add_row("Recuperadas na retentativa", f"[green]{stats['retentadas_ok']}[/green]")
+    if stats.get('recuperacoes') and any(stats['recuperacoes'].values()):
+        r = stats['recuperacoes']
+        tabela.add_row("Recuperações", f"painéis {r['paineis']} / recarga {r['recarga']} / driver {r['driver']}")
+    if stats.get('sucesso') and stats['bytes_html'][0]:
+        antes, depois = stats['bytes_html']
+        tabela.add_row("HTML por card", f"{antes / stats['sucesso'] / 1024:.1f} KB → {depois / stats['sucesso'] / 1024:.1f} KB "
+                                        f"([green]-{(antes - depois) / stats['sucesso'] / 1024:.1f} KB[/green])")
+    if stats.get('reciclagens'):
+        tabela.add_row("Navegador reciclado", f"{stats['reciclagens']}x")
     tabela.add_row("Tempo", stats['tempo'])
+    if stats.get('tempos_carga'):
+        tempos = stats['tempos_carga']
+        tabela.add_row("Carga por questão", f"média {sum(tempos) / len(tempos):.2f}s / máx {max(tempos):.2f}s")
+    if stats.get('midia') and stats['midia']['imagens']:
+        m = stats['midia']
+        economia = m['originais'] - m['finais']
+        tabela.add_row("Imagens", f"{m['imagens']} compactadas ({m['originais'] / 1e6:.1f} MB → {m['finais'] / 1e6:.1f} MB, "
+                                  f"[green]{economia / 1e6:.1f} MB economizados[/green])")
+    if stats.get('ritmo'):
+        r = stats['ritmo']
+        tabela.add_row("Ritmo final", f"{r['taxa']:.2f} ações/s (resposta média {r['tempo_medio']:.2f}s)")
+        tabela.add_row("Backoffs", f"[yellow]{len(r['backoffs'])}[/yellow]")
+        for ev in r['backoffs'][-5:]:
+            tabela.add_row("", f"[dim]{ev['acao']}: {ev['motivo']} ({ev['de']:.2f} → {ev['para']:.2f})[/dim]")
     tabela.add_row("Deck", stats['deck'])
+    if stats.get('arquivo'):
+        tabela.add_row("Arquivo", stats['arquivo'])
     if stats.get('forum'):
         tabela.add_row("Forum", "[green]Ativado[/green]")
     
     console.print(Panel(tabela, title="[bold green]CONCLUÍDO[/bold green]", border_style="green"))
+    
+    if stats.get('progresso'):
+        exibir_resultados_lista(stats['ids'], stats['progresso'])
+
+def exibir_resultados_lista(ids: list, progresso: ProgressoLista):
+    """Mostra o resultado de cada ID da lista processada"""
+    resultados = [progresso.resultados.get(i, "não processada") for i in ids]
+    
+    contagem = {}
+    for r in resultados:
+        chave = "erro" if r.startswith("erro") else r
+        contagem[chave] = contagem.get(chave, 0) + 1
+    resumo = ", ".join(f"{k}: {v}" for k, v in contagem.items())
+    console.print(f"[cyan]Resultados da lista:[/cyan] {resumo}")
+    console.print(f"[dim]Detalhes por ID em {progresso.caminho}[/dim]")
+    
+    if len(ids) <= 50:
+        tabela = Table(box=box.SIMPLE, padding=(0, 1))
+        tabela.add_column("ID", style="cyan")
+        tabela.add_column("Resultado")
+        for id_questao, r in zip(ids, resultados):
+            cor = "green" if r in RESULTADOS_CONCLUIDOS else ("red" if r.startswith("erro") else "yellow")
+            tabela.add_row(id_questao, f"[{cor}]{escape(r)}[/{cor}]")
+        console.print(tabela)
 
 # ═══════════════════════════════════════════════════════════════════════
 # MAIN
 # ═══════════════════════════════════════════════════════════════════════
 
+def processar_questao_atual(nav: NavegadorTEC, anki, registro: RegistroHashes,
+                            exportador: Optional[ExportadorJSONL], config: dict,
+                            midia: Optional[TranscodificadorMidia] = None,
+                            similaridade: Optional[IndiceSimilaridade] = None,
+                            retentativa: bool = False) -> dict:
+    """Captura, processa e envia a questão aberta. Cada etapa tem prazo (PRAZOS)"""
+    deck, incluir_forum, atualizar = config["deck"], config["incluir_forum"], config["atualizar"]
+    resultado = {"sem_comentario": False, "sem_forum": False, "envio": None, "id": None, "bytes_html": (0, 0)}
+    
+    # 1. CAPTURA QUESTÃO (e o comentário oficial no mesmo snapshot, se não houver checagem de duplicatas)
+    console.print("[cyan]Capturando questão...[/cyan]")
+    snapshot = None
+    comentario_abriu = html_comentario = None
+    if CAPTURA_SNAPSHOT:
+        partes = ("questao",)
+        if not similaridade:
+            comentario_abriu = executar_com_prazo("comentario", nav.abrir_comentario)
+            partes = ("questao", "comentario")
+        snapshot = executar_com_prazo("captura", nav.forum_manager.capturar_snapshot, partes)
+    
+    if snapshot and snapshot.get("questao"):
+        html_questao = snapshot["questao"]
+        if comentario_abriu is not None:
+            html_comentario = snapshot.get("comentario") or COMENTARIO_INDISPONIVEL
+    else:
+        html_questao = executar_com_prazo("captura", nav.capturar_questao)
+        if not html_questao:
+            raise FalhaNavegador("Falha ao capturar questão")
+        if comentario_abriu is not None:
+            # Comentário já foi aberto acima; não reenvia a tecla
+            html_comentario = executar_com_prazo("comentario", nav.capturar_comentario)
+    
+    id_questao = nav.obter_id_questao(html_questao)
+    resultado["id"] = id_questao
+    console.print(f"[green]Questão capturada{f' (#{id_questao})' if id_questao else ''}[/green]")
+    questao = processar_questao(html_questao, id_questao)
+    
+    # QUASE DUPLICATAS (antes de abrir comentário e fórum)
+    tags = []
+    assinatura = None
+    texto, palavras = texto_questao(questao) if similaridade else ("", 0)
+    if palavras >= DUPLICATAS_MIN_PALAVRAS:
+        assinatura = IndiceSimilaridade.assinatura(texto)
+        achado = similaridade.consultar(assinatura, ignorar=id_questao)
+        if achado:
+            resultado["duplicada_de"] = achado[0]
+            console.print(f"[yellow]Quase duplicata de #{achado[0]} (similaridade {achado[1]:.2f})[/yellow]")
+            if DUPLICATAS_ACAO == "pular":
+                resultado["envio"] = "duplicada"
+                if config["modo"] == "aleatoria":
+                    executar_com_prazo("navegacao", nav.responder_questao_c)
+                return resultado
+            tags.append(DUPLICATAS_TAG)
+    
+    # 2. CAPTURA COMENTÁRIO OFICIAL
+    if html_comentario is None and CAPTURA_SNAPSHOT:
+        # Depois da checagem de duplicatas: abre o comentário e lê só ele num snapshot
+        comentario_abriu = executar_com_prazo("comentario", nav.abrir_comentario)
+        snapshot_comentario = executar_com_prazo("captura", nav.forum_manager.capturar_snapshot, ("comentario",))
+        html_comentario = snapshot_comentario.get("comentario") or COMENTARIO_INDISPONIVEL
+    elif html_comentario is None:
+        comentario_abriu, html_comentario = executar_com_prazo(
+            "comentario", lambda: (nav.abrir_comentario(), nav.capturar_comentario())
+        )
+    
+    if COMENTARIO_INDISPONIVEL in html_comentario or not comentario_abriu:
+        resultado["sem_comentario"] = True
+        html_comentario = COMENTARIO_INDISPONIVEL
+    else:
+        console.print("[green]Comentário oficial capturado[/green]")
+    
+    # 3. CAPTURA COMENTÁRIOS DO FÓRUM
+    html_forum = ""
+    comentarios_forum = []
+    if incluir_forum:
+        comentarios_forum = executar_com_prazo("forum", nav.capturar_registros_forum)
+        
+        if not comentarios_forum:
+            html_forum = FORUM_INDISPONIVEL
+            resultado["sem_forum"] = True
+        elif not config["forum_json"]:
+            html_forum = nav.forum_manager.formatar_para_anki(comentarios_forum)
+            console.print("[green]Forum capturado[/green]")
+        else:
+            console.print("[green]Forum capturado[/green]")
+    
+    # 4. PROCESSA HTML
+    console.print("[cyan]Processando HTML...[/cyan]")
+    questao_limpa = questao.html
+    comentario_limpo = processar_html(html_comentario) if COMENTARIO_INDISPONIVEL not in html_comentario else COMENTARIO_INDISPONIVEL
+    
+    if exportador:
+        comentario = ComentarioOficial(comentario_limpo) if comentario_limpo != COMENTARIO_INDISPONIVEL else None
+        exportador.escrever(questao, comentario, comentarios_forum)
+    
+    # 5. MONTA VERSO COMBINADO
+    if incluir_forum and html_forum and FORUM_INDISPONIVEL not in html_forum:
+        separador = '''
+        <div style="margin: 30px 0; text-align: center;">
+            <hr style="border: none; border-top: 3px solid #2196F3; width: 80%; margin: 20px auto;">
+        </div>
+        '''
+        verso_final = f"{comentario_limpo}{separador}{html_forum}"
+    else:
+        verso_final = comentario_limpo
+    
+    # Fórum diferido: só os textos vão ao campo Forum; o template monta o HTML na revisão
+    textos_forum = [c.texto_html for c in comentarios_forum] if config["forum_json"] else []
+    
+    # As imagens do campo Forum ficam com a URL remota: escapadas no JSON, referências locais
+    # não seriam vistas pela verificação de mídia do Anki (arquivo tratado como não usado)
+    # Sem thread auxiliar: cada download já tem timeout (PRAZOS["midia"]) e uma thread
+    # abandonada disputaria cache, sessão HTTP e arquivos temporários com a próxima questão
+    if midia:
+        questao_limpa, verso_final = midia.processar(questao_limpa, verso_final)
+    
+    # Minificação final (só é aplicada se o texto exibido continuar igual)
+    antes = sum(len(h.encode("utf-8")) for h in [questao_limpa, verso_final] + textos_forum)
+    questao_limpa, verso_final = minificar_html(questao_limpa), minificar_html(verso_final)
+    textos_forum = [minificar_html(t) for t in textos_forum]
+    resultado["bytes_html"] = (antes, sum(len(h.encode("utf-8")) for h in [questao_limpa, verso_final] + textos_forum))
+    forum_json = serializar_forum(comentarios_forum, textos_forum) if config["forum_json"] else None
+    
+    console.print("[green]HTML processado[/green]")
+    
+    # 6. ENVIA PARA ANKI (no modo atualização, só se o conteúdo mudou)
+    # Só o que é da questão entra no hash: pontuação geral e avatar dos autores do fórum
+    # mudam sozinhos com o tempo e fariam reenviar cards cujo conteúdo não mudou
+    forum_estavel = None
+    if comentarios_forum:
+        formato = "json" if config["forum_json"] else "html"
+        forum_estavel = f"{formato}:{serializar_forum(comentarios_forum)}"
+    hash_conteudo = RegistroHashes.calcular_hash(questao_limpa, comentario_limpo, forum_estavel)
+    conhecida = registro.obter(deck, id_questao) if atualizar else None
+    
+    # O registro é feito dentro da thread: um envio que termina após o prazo ainda fica registrado
+    def atualizar_nota():
+        anki.atualizar_nota(conhecida["nota"], questao_limpa, verso_final, forum_json)
+        registro.registrar(deck, id_questao, conhecida["nota"], hash_conteudo)
+    
+    def adicionar_nota():
+        nota_id = anki.adicionar_nota(deck, questao_limpa, verso_final,
+                                      id_questao=id_questao, forum=forum_json, tags=tags)
+        registro.registrar(deck, id_questao, nota_id, hash_conteudo)
+    
+    if retentativa and id_questao and registro.enviada(deck, id_questao):
+        console.print("[dim]Já gravada no Anki nesta execução (envio concluído após o prazo) - não reenviada[/dim]")
+        resultado["envio"] = "atualizada" if conhecida else "criada"
+    elif conhecida and conhecida["hash"] == hash_conteudo:
+        console.print("[dim]Conteúdo inalterado - Anki não modificado[/dim]")
+        resultado["envio"] = "inalterada"
+    elif conhecida:
+        console.print("[cyan]Atualizando card existente...[/cyan]")
+        executar_com_prazo("anki", atualizar_nota)
+        console.print("[green]Card atualizado[/green]")
+        resultado["envio"] = "atualizada"
+    else:
+        console.print("[cyan]Enviando para Anki...[/cyan]")
+        executar_com_prazo("anki", adicionar_nota)
+        console.print(f"[green]Card criado no deck '{deck}'[/green]")
+        resultado["envio"] = "criada"
+    
+    if assinatura and not tags:
+        similaridade.adicionar(id_questao or hash_conteudo, assinatura)
+    
+    # 7. RESPONDE (se modo aleatória)
+    if config["modo"] == "aleatoria":
+        console.print("[cyan]Respondendo questão (C)...[/cyan]")
+        executar_com_prazo("navegacao", nav.responder_questao_c)
+    
+    return resultado
+
+def contabilizar(stats: dict, resultado: dict):
+    """Soma o resultado de uma questão processada com sucesso às estatísticas"""
+    if resultado["envio"] == "duplicada":
+        stats["duplicadas"] += 1
+        return
+    if resultado.get("duplicada_de"):
+        stats["duplicadas"] += 1
+    stats["sucesso"] += 1
+    stats["bytes_html"] = [a + b for a, b in zip(stats["bytes_html"], resultado["bytes_html"])]
+    if resultado["sem_comentario"]:
+        stats["sem_comentario"] += 1
+    if resultado["sem_forum"]:
+        stats["sem_forum"] += 1
+    if resultado["envio"] == "atualizada":
+        stats["atualizadas"] += 1
+    elif resultado["envio"] == "inalterada":
+        stats["inalteradas"] += 1
+
 def main():
     """Função principal"""
     inicio = time.time()
     
     exibir_titulo()
     
-    deck, quantidade, modo, incluir_forum = solicitar_config()
+    config = solicitar_config()
+    deck, quantidade, modo, incluir_forum = config["deck"], config["quantidade"], config["modo"], config["incluir_forum"]
+    atualizar = config["atualizar"]
     
     console.print("\n[cyan]Validando pré-requisitos...[/cyan]")
-    anki = AnkiClient()
+    if config["destino"] == "apkg":
+        nome_arquivo = re.sub(r"[^\w\-. ]", "_", deck) or "tecanki"
+        # Um arquivo por execução: retomadas e workers da mesma lista não se sobrescrevem
+        anki = PacoteAnki(os.path.join(SAIDA_APKG_DIR, f"{nome_arquivo}_{time.strftime('%Y%m%d-%H%M%S')}.apkg"))
+        pronto = anki.usar_modelo_tecanki() if config["forum_json"] else anki.detectar_modelo_e_campos()
+        anki.criar_deck(deck)
+    else:
+        anki = AnkiClient()
+        
+        # Versão, perfil, deck e modelo numa única requisição (multi)
+        try:
+            pronto = anki.handshake(deck, tecanki=config["forum_json"])
+        except requests.RequestException:
+            console.print("[red]Anki não está rodando ou AnkiConnect não instalado[/red]")
+            console.print("[yellow]Instale: https://ankiweb.net/shared/info/2055492159[/yellow]")
+            return
     
-    if not anki.testar_conexao():
-        console.print("[red]Anki não está rodando ou AnkiConnect não instalado[/red]")
-        console.print("[yellow]Instale: https://ankiweb.net/shared/info/2055492159[/yellow]")
+    if not pronto:
+        if not config["forum_json"]:
+            console.print("[red]Não foi possível detectar modelo Basic/Básico[/red]")
+            console.print("[yellow]Crie um modelo 'Basic' com campos 'Front'/'Back'[/yellow]")
+            console.print("[yellow]ou 'Básico' com campos 'Frente'/'Verso' no Anki[/yellow]")
         return
     
-    console.print("[green]AnkiConnect OK[/green]")
-    
-    if not anki.detectar_modelo_e_campos():
-        console.print("[red]Não foi possível detectar modelo Basic/Básico[/red]")
-        console.print("[yellow]Crie um modelo 'Basic' com campos 'Front'/'Back'[/yellow]")
-        console.print("[yellow]ou 'Básico' com campos 'Frente'/'Verso' no Anki[/yellow]")
-        return
+    console.print(f"[green]Deck '{deck}' pronto[/green]")
     
-    try:
-        anki.criar_deck(deck)
-        console.print(f"[green]Deck '{deck}' pronto[/green]")
-    except Exception as e:
-        console.print(f"[red]Erro ao criar deck: {e}[/red]")
-        return
+    # No .apkg os IDs de nota são descartáveis: o registro fica só em memória
+    registro = RegistroHashes(None if isinstance(anki, PacoteAnki) else ARQUIVO_HASHES)
+    registro.carregar()
+    if atualizar and registro.decks:
+        try:
+            removidas = registro.validar_com_anki(anki)
+            console.print(f"[green]{registro.total(deck)} questões conhecidas no deck ({removidas} notas removidas do Anki)[/green]")
+        except Exception as e:
+            console.print(f"[red]Erro ao consultar notas existentes: {e}[/red]")
+            return
     
-    nav = NavegadorTEC()
+    nav = NavegadorTEC(config["navegador"])
     try:
         nav.iniciar()
-        nav.navegar_tec()
+        nav.navegar_tec(config["url_inicial"], lista=bool(config["ids"]))
         
-        if not nav.validar_questao():
+        if not config["ids"] and not nav.validar_questao():
             console.print("[red]Não está numa página de questão[/red]")
             return
         
@@ -963,6 +3368,18 @@ def main():
         console.print(f"[red]Erro no navegador: {e}[/red]")
         return
     
+    midia = None
+    if TRANSCODIFICAR_IMAGENS:
+        if Image is None:
+            console.print("[yellow]Pillow não instalado - imagens mantidas como estão (pip install Pillow)[/yellow]")
+        else:
+            midia = TranscodificadorMidia(anki)
+            midia.carregar()
+            try:
+                midia.usar_cookies(nav.driver.get_cookies())
+            except Exception:
+                pass
+    
     stats = {
         "total": quantidade, 
         "sucesso": 0, 
@@ -970,93 +3387,136 @@ def main():
         "sem_forum": 0,
         "erros": 0, 
         "deck": deck,
-        "forum": incluir_forum
+        "forum": incluir_forum,
+        "atualizar": atualizar,
+        "atualizadas": 0,
+        "inalteradas": 0,
+        "retentadas_ok": 0,
+        "duplicadas": 0,
+        "nao_encontradas": 0,
+        "bytes_html": [0, 0]
     }
     
-    console.print("[bold green]PROCESSANDO QUESTÕES[/bold green]\n")
+    exportador = ExportadorJSONL() if EXPORTAR_JSONL else None
+    similaridade = None
+    if DUPLICATAS_ACAO:
+        similaridade = IndiceSimilaridade()
+        similaridade.carregar()
+        console.print(f"[green]Índice de similaridade: {len(similaridade.assinaturas)} questões[/green]")
+    fila_retentativa = []
+    ids = config["ids"]
+    progresso = config["progresso"]
     
-    with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), 
-                  BarColumn(), TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                  console=console) as progress:
+    try:
+        console.print("[bold green]PROCESSANDO QUESTÕES[/bold green]\n")
+    
+        with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), 
+                      BarColumn(), TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+                      console=console) as progress:
         
-        task = progress.add_task(f"[cyan]Processando...", total=quantidade)
+            task = progress.add_task(f"[cyan]Processando...", total=quantidade)
         
-        for i in range(1, quantidade + 1):
-            console.print(f"\n[bold cyan]--- Questão {i}/{quantidade} ---[/bold cyan]")
+            for i in range(1, quantidade + 1):
+                id_lista = ids[i - 1] if ids else None
+                url_questao = None
+                console.print(f"\n[bold cyan]--- Questão {i}/{quantidade}{f' (#{id_lista})' if id_lista else ''} ---[/bold cyan]")
             
-            try:
-                # 1. CAPTURA QUESTÃO
-                console.print("[cyan]Capturando questão...[/cyan]")
-                html_questao = nav.capturar_questao()
-                if not html_questao:
-                    raise Exception("Falha ao capturar questão")
-                console.print("[green]Questão capturada[/green]")
-                
-                # 2. CAPTURA COMENTÁRIO OFICIAL
-                comentario_abriu = nav.abrir_comentario()
-                html_comentario = nav.capturar_comentario()
-                
-                if COMENTARIO_INDISPONIVEL in html_comentario or not comentario_abriu:
-                    stats["sem_comentario"] += 1
-                    html_comentario = COMENTARIO_INDISPONIVEL
-                else:
-                    console.print("[green]Comentário oficial capturado[/green]")
-                
-                # 3. CAPTURA COMENTÁRIOS DO FÓRUM
-                html_forum = ""
-                if incluir_forum:
-                    html_forum = nav.capturar_comentarios_forum()
-                    
-                    if FORUM_INDISPONIVEL in html_forum:
-                        stats["sem_forum"] += 1
+                try:
+                    if id_lista:
+                        # Modo lista: acesso direto pela URL da questão
+                        url_questao = URL_QUESTAO.format(id=id_lista)
+                        if not nav.abrir_questao(url_questao):
+                            raise QuestaoNaoEncontrada(id_lista)
                     else:
-                        console.print("[green]Forum capturado[/green]")
-                
-                # 4. PROCESSA HTML
-                console.print("[cyan]Processando HTML...[/cyan]")
-                questao_limpa = processar_html(html_questao)
-                comentario_limpo = processar_html(html_comentario) if COMENTARIO_INDISPONIVEL not in html_comentario else COMENTARIO_INDISPONIVEL
-                
-                # 5. MONTA VERSO COMBINADO
-                if incluir_forum and html_forum and FORUM_INDISPONIVEL not in html_forum:
-                    separador = '''
-                    <div style="margin: 30px 0; text-align: center;">
-                        <hr style="border: none; border-top: 3px solid #2196F3; width: 80%; margin: 20px auto;">
-                    </div>
-                    '''
-                    verso_final = f"{comentario_limpo}{separador}{html_forum}"
-                else:
-                    verso_final = comentario_limpo
-                
-                console.print("[green]HTML processado[/green]")
+                        url_questao = nav.url_atual()
                 
-                # 6. ENVIA PARA ANKI
-                console.print("[cyan]Enviando para Anki...[/cyan]")
-                anki.adicionar_nota(deck, questao_limpa, verso_final)
-                console.print(f"[green]Card criado no deck '{deck}'[/green]")
-                
-                stats["sucesso"] += 1
-                
-                # 7. RESPONDE (se modo aleatória)
-                if modo == "aleatoria":
-                    console.print("[cyan]Respondendo questão (C)...[/cyan]")
-                    nav.responder_questao_c()
-                
-                # 8. NAVEGA (exceto última questão)
-                if i < quantidade:
+                    resultado = processar_questao_atual(nav, anki, registro, exportador, config, midia, similaridade)
+                    contabilizar(stats, resultado)
+                    if id_lista:
+                        progresso.registrar(id_lista, resultado["envio"])
+                except QuestaoNaoEncontrada:
+                    # A página carregou: o navegador está bem, só o ID não existe mais
+                    stats["nao_encontradas"] += 1
+                    console.print("[yellow]Questão não encontrada (removida ou ID inválido) - pulando[/yellow]")
+                    progresso.registrar(id_lista, NAO_ENCONTRADA)
+                except Exception as e:
+                    stats["erros"] += 1
+                    console.print(f"[red]Erro: {e}[/red]")
+                    if id_lista:
+                        progresso.registrar(id_lista, f"erro: {e}")
+                    if url_questao:
+                        fila_retentativa.append((url_questao, id_lista))
+                    if isinstance(e, ERROS_NAVEGADOR) and not nav.recuperar(url_questao):
+                        console.print("[red]Não foi possível recuperar o navegador - encerrando[/red]")
+                        break
+            
+                # 8. NAVEGA (exceto última questão; no modo lista o acesso é direto)
+                if i < quantidade and not ids:
                     console.print("[cyan]Navegando para próxima...[/cyan]")
-                    if not nav.navegar_proxima(modo):
-                        raise Exception("Falha ao navegar")
-                    console.print("[green]Próxima questão[/green]")
+                    if not nav.navegar_com_recuperacao(modo):
+                        console.print("[red]Falha ao navegar mesmo após recuperação - encerrando[/red]")
+                        break
+                    carga = f" [dim](carga {nav.ultima_carga:.2f}s)[/dim]" if nav.ultima_carga is not None else ""
+                    console.print(f"[green]Próxima questão[/green]{carga}")
             
+                progress.update(task, advance=1)
+    
+        # Fila de retentativa: questões que falharam são refeitas uma vez, no final
+        if fila_retentativa and RETENTAR_FALHAS:
+            console.print(f"\n[bold yellow]RETENTANDO {len(fila_retentativa)} QUESTÕES[/bold yellow]")
+            for url_questao, id_lista in fila_retentativa:
+                console.print(f"\n[bold cyan]--- Retentativa: {url_questao} ---[/bold cyan]")
+                try:
+                    if not nav.abrir_questao(url_questao):
+                        raise QuestaoNaoEncontrada(id_lista)
+                    resultado = processar_questao_atual(nav, anki, registro, exportador, config, midia, similaridade,
+                                                        retentativa=True)
+                    contabilizar(stats, resultado)
+                    stats["erros"] -= 1
+                    stats["retentadas_ok"] += 1
+                    if id_lista:
+                        progresso.registrar(id_lista, resultado["envio"])
+                except QuestaoNaoEncontrada:
+                    stats["erros"] -= 1
+                    stats["nao_encontradas"] += 1
+                    console.print("[yellow]Questão não encontrada - pulando[/yellow]")
+                    if id_lista:
+                        progresso.registrar(id_lista, NAO_ENCONTRADA)
+                except Exception as e:
+                    console.print(f"[red]Erro na retentativa: {e}[/red]")
+                    if id_lista:
+                        progresso.registrar(id_lista, f"erro: {e}")
+                    if isinstance(e, ERROS_NAVEGADOR) and not nav.recuperar(None):
+                        break
+    
+    finally:
+        # Também em Ctrl-C ou erro fatal: nada do que já foi processado se perde
+        registro.salvar()
+        if similaridade:
+            similaridade.salvar()
+        if exportador:
+            exportador.fechar()
+        if midia:
+            midia.fechar()
+            stats["midia"] = midia.resumo()
+        if progresso:
+            progresso.salvar()
+            stats["progresso"] = progresso
+            stats["ids"] = ids
+        
+        if isinstance(anki, PacoteAnki):
+            try:
+                stats["arquivo"] = anki.finalizar()
+                console.print(f"[green]{len(anki.notas)} notas gravadas em {stats['arquivo']}[/green]")
             except Exception as e:
-                stats["erros"] += 1
-                console.print(f"[red]Erro: {e}[/red]")
-            
-            progress.update(task, advance=1)
+                console.print(f"[red]Erro ao gravar pacote .apkg: {e}[/red]")
     
     tempo_total = time.time() - inicio
     stats["tempo"] = f"{int(tempo_total//60)}min {int(tempo_total%60)}s"
+    stats["ritmo"] = ritmo.resumo()
+    stats["tempos_carga"] = nav.tempos_carga
+    stats["recuperacoes"] = nav.recuperacoes
+    stats["reciclagens"] = nav.reciclagens
     
     console.print("\n")
     exibir_relatorio(stats)
@@ -1066,9 +3526,40 @@ def main():
     except:
         pass
 
+def comando_daemon(args: list):
+    """python tecanki.py daemon iniciar|parar|status [normal|enxuto|headless]"""
+    acao = args[0] if args else "status"
+    modo = args[1] if len(args) > 1 else "normal"
+    if acao == "iniciar":
+        iniciar_daemon(modo)
+    elif acao == "parar":
+        parar_daemon()
+    elif acao == "status":
+        status_daemon()
+    else:
+        console.print(f"[red]Ação desconhecida: {acao}[/red]")
+        console.print("[yellow]Uso: python tecanki.py daemon iniciar|parar|status [normal|enxuto|headless][/yellow]")
+
+def comando_similaridade(args: list):
+    """python tecanki.py similaridade avaliar <pares.jsonl> | status"""
+    acao = args[0] if args else "status"
+    if acao == "avaliar" and len(args) > 1:
+        avaliar_similaridade(args[1])
+    elif acao == "status":
+        indice = IndiceSimilaridade()
+        indice.carregar()
+        console.print(f"[green]{len(indice.assinaturas)} questões no índice ({indice.caminho})[/green]")
+    else:
+        console.print("[yellow]Uso: python tecanki.py similaridade avaliar <pares.jsonl> | status[/yellow]")
+
 if __name__ == "__main__":
     try:
-        main()
+        if len(sys.argv) > 1 and sys.argv[1] == "daemon":
+            comando_daemon(sys.argv[2:])
+        elif len(sys.argv) > 1 and sys.argv[1] == "similaridade":
+            comando_similaridade(sys.argv[2:])
+        else:
+            main()
     except KeyboardInterrupt:
         console.print("\n[yellow]Interrompido pelo usuário[/yellow]")
     except Exception as e: